@@ -9,13 +9,25 @@ import argparse
 import difflib
 import traceback
 import requests
+import numpy as np
 import re
+import heapq
+import hashlib
+import bisect
+import itertools
+import sqlite3
 import threading
-from functools import lru_cache
-from datetime import datetime, timedelta
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 
+import http_cassette
+import scoreline_engine
+
 VERSION = "v4.6"
 
 # ===========================
@@ -23,13 +35,18 @@ VERSION = "v4.6"
 # ===========================
 
 # يجب ضبط مفتاح API عبر متغير البيئة FOOTBALL_DATA_API_KEY
-API_KEY = os.getenv("FOOTBALL_DATA_API_KEY")
-if not API_KEY:
+# عدة مفاتيح (مفصولة بفواصل) عبر FOOTBALL_DATA_API_KEYS → مجمّع مفاتيح بمحدد معدل مستقل لكل مفتاح
+API_KEYS = list(dict.fromkeys(
+    k.strip() for k in (os.getenv("FOOTBALL_DATA_API_KEYS", "") + "," + os.getenv("FOOTBALL_DATA_API_KEY", "")).split(",")
+    if k.strip()
+))
+API_KEY = API_KEYS[0] if API_KEYS else None
+if not API_KEY and not http_cassette.replaying():
     raise RuntimeError("يرجى ضبط FOOTBALL_DATA_API_KEY في متغيرات البيئة.")
 
 BASE_URL = "https://api.football-data.org/v4"
+# X-Auth-Token يُضاف لكل طلب حسب المفتاح المختار من المجمّع
 HEADERS = {
-    "X-Auth-Token": API_KEY,
     "User-Agent": f"FD-Predictor/{VERSION} (+https://football-data.org)"
 }
 
@@ -44,21 +61,38 @@ _retry = Retry(
 )
 SESSION.mount("https://", HTTPAdapter(max_retries=_retry))
 
-# محدد معدل بسيط للطلبات (لتجنّب 429)
-_MIN_INTERVAL_SEC = float(os.getenv("FD_MIN_INTERVAL_SEC", "6.5"))  # تباعد افتراضي بين الطلبات
-_last_call_ts = 0.0
-_last_call_lock = threading.Lock()
+# محدد معدل (Token Bucket) يتكيّف مع ترويسات الخادم (لتجنّب 429)
+# FD_RATE_PER_MIN: حصة الدقيقة المبدئية (الخطة المجانية = 10). للتوافق: FD_MIN_INTERVAL_SEC القديم يُحوَّل إلى حصة مكافئة.
+_legacy_interval = os.getenv("FD_MIN_INTERVAL_SEC")
+if os.getenv("FD_RATE_PER_MIN"):
+    RATE_PER_MIN = float(os.getenv("FD_RATE_PER_MIN"))
+elif _legacy_interval is not None:
+    RATE_PER_MIN = (60.0 / float(_legacy_interval)) if float(_legacy_interval) > 0 else 0.0
+else:
+    RATE_PER_MIN = 10.0
+RATE_LIMIT_FALLBACK_WAIT = int(os.getenv("FD_RATE_LIMIT_FALLBACK_WAIT", "60"))  # عند 429 بلا ترويسات
+# مدة إيقاف مفتاح بعد 401 (أو بعد 403 لنفس المسار) — فقط إن بقي مفتاح آخر صالح يحل محله؛
+# المفتاح الأخير (أو الوحيد) لا يُوقف: يُبلَّغ المستدعي بالرفض ويُعاد تجريبه في الطلب التالي
+KEY_QUARANTINE_SEC = int(os.getenv("FD_KEY_QUARANTINE_SEC", "3600"))
+# توكنات تُترك للطلبات التفاعلية ما دام هناك توقع تفاعلي جارٍ (العمل الخلفي لا يستهلكها)
+BACKGROUND_RESERVE = int(os.getenv("FD_BACKGROUND_RESERVE", "2"))
 
 # حدود/إعدادات قابلة للتعديل عبر متغيرات البيئة
 MATCHES_CHUNK_DAYS = int(os.getenv("FD_MATCHES_CHUNK_DAYS", "30"))  # شريحة /matches (رفعت من 10 → 30)
 TEAM_MATCHES_CHUNK_DAYS = int(os.getenv("FD_TEAM_MATCHES_CHUNK_DAYS", "30"))  # شريحة /teams/{id}/matches (رفعت من 10 → 30)
 MAX_CHUNKS = int(os.getenv("FD_MAX_CHUNKS", "120"))  # أقصى عدد شرائح
+SEASON_BULK = os.getenv("FD_SEASON_BULK", "1").strip().lower() in ("1", "true", "yes", "y")  # موسم كامل بطلب واحد
 H2H_LOOKBACK_DAYS = int(os.getenv("FD_H2H_LOOKBACK_DAYS", "365"))  # سنة واحدة افتراضياً
+SYNC_OVERLAP_DAYS = int(os.getenv("FD_SYNC_OVERLAP_DAYS", "3"))  # تداخل خلف الـ watermark لالتقاط النتائج المتأخرة
+SYNC_MIN_INTERVAL_SEC = int(os.getenv("FD_SYNC_MIN_INTERVAL_SEC", str(15 * 60)))  # أقل فاصل لإعادة مزامنة الحافة الحديثة
 
 # انكماش أقوى + EWMA أنعم
 PRIOR_GAMES = int(os.getenv("FD_PRIOR_GAMES", "12"))  # كان 6 -> الآن 12
 HALF_LIFE_DAYS = int(os.getenv("FD_HALF_LIFE_DAYS", "270"))  # كان 180 -> الآن 270
 DC_RHO_MAX = float(os.getenv("FD_DC_RHO_MAX", "0.3"))  # حد |rho|
+# محرك قوى الفرق: ratio (التكراري + rho لاحقاً) أو dc_mle (Dixon-Coles مشترك: هجوم/دفاع/أرض/rho معاً)
+STRENGTH_ENGINE = os.getenv("FD_STRENGTH_ENGINE", "ratio").strip().lower()
+DC_MLE_RIDGE = float(os.getenv("FD_DC_MLE_RIDGE", "1.0"))  # انكماش L2 لـ log(A)/log(D) (بوحدة مباريات موزونة)
 
 # قصّ λ النهائي (شبكة أمان)
 LAM_CLAMP_MIN = float(os.getenv("FD_LAM_CLAMP_MIN", "0.1"))
@@ -67,11 +101,18 @@ LAM_CLAMP_MAX = float(os.getenv("FD_LAM_CLAMP_MAX", "3.0"))
 # قصّ قوى الهجوم/الدفاع A/D — أضيق لتقليل التطرف
 AD_CLAMP_MIN = float(os.getenv("FD_AD_CLAMP_MIN", "0.7"))  # كان 0.5
 AD_CLAMP_MAX = float(os.getenv("FD_AD_CLAMP_MAX", "1.3"))  # كان 1.5
+# حلّ A/D التكراري: يتوقف عند تغيّر أقل من AD_TOL (أو بعد AD_MAX_ITERS)
+AD_MAX_ITERS = int(os.getenv("FD_AD_MAX_ITERS", "100"))
+AD_TOL = float(os.getenv("FD_AD_TOL", "1e-6"))
 
 # ELO: حدود تأثيره على λ + مقياس التأثير
 ELO_LAM_MIN = float(os.getenv("FD_ELO_LAM_MIN", "0.88"))  # كان 0.9 -> الآن 0.88
 ELO_LAM_MAX = float(os.getenv("FD_ELO_LAM_MAX", "1.12"))  # كان 1.1 -> الآن 1.12
 ELO_SCALE = float(os.getenv("FD_ELO_SCALE", "0.28"))  # كان 0.2 -> الآن 0.28 (قابل للضبط)
+# مصدر ELO: season (لكل مسابقة/موسم من 1500) أو global (كل المسابقات المخزنة عبر المواسم)
+ELO_SOURCE = os.getenv("FD_ELO_SOURCE", "season").strip().lower()
+ELO_SEASON_GAP_DAYS = int(os.getenv("FD_ELO_SEASON_GAP_DAYS", "45"))  # فجوة بلا مباريات = موسم جديد
+ELO_REGRESS = float(os.getenv("FD_ELO_REGRESS", "0.25"))  # نسبة الارتداد نحو 1500 بين المواسم
 
 MAX_GOALS_GRID = int(os.getenv("FD_MAX_GOALS_GRID", "8"))  # شبكة حساب الاحتمالات (احتياطي)
 
@@ -112,6 +153,17 @@ PROB_TEMP = float(os.getenv("FD_PROB_TEMP", "1.0"))  # <1 تفلط، >1 تشدّ
 # TTL للكاش (ثوانٍ)
 TTL_COMPETITIONS = int(os.getenv("FD_TTL_COMPETITIONS", str(6 * 3600)))  # 6 ساعات
 TTL_TEAMS = int(os.getenv("FD_TTL_TEAMS", str(24 * 3600)))  # 24 ساعة (سكواد يتغير ببطء)
+TTL_STANDINGS = int(os.getenv("FD_TTL_STANDINGS", str(30 * 60)))  # 30 دقيقة
+TTL_MATCHES = int(os.getenv("FD_TTL_MATCHES", str(30 * 60)))  # نوافذ مباريات مفتوحة/قادمة
+TTL_DEFAULT = int(os.getenv("FD_TTL_DEFAULT", str(3600)))
+
+# كاش دائم على القرص (SQLite) أسفل make_api_request — يبقى بعد إعادة التشغيل ويُشارك بين عمّال Streamlit
+DISK_CACHE_ENABLED = os.getenv("FD_DISK_CACHE", "1").strip().lower() in ("1", "true", "yes", "y")
+DISK_CACHE_PATH = os.getenv("FD_CACHE_DB") or os.path.join(os.path.expanduser("~"), ".cache", "fd_predictor", "api_cache.sqlite3")
+# نوافذ FINISHED التي انتهت قبل هذا العدد من الأيام لا تتغير → تُحفظ للأبد
+FINISHED_SETTLE_DAYS = int(os.getenv("FD_FINISHED_SETTLE_DAYS", "2"))
+# كاش ملاءمة A/D (ذاكرة + نفس ملف SQLite) مع بدء دافئ من أقرب ملاءمة سابقة
+FIT_CACHE_ENABLED = os.getenv("FD_FIT_CACHE", "1").strip().lower() in ("1", "true", "yes", "y")
 
 # ===========================
 # تعزيزات إضافية (قابلة للضبط عبر Env)
@@ -156,6 +208,15 @@ FATIGUE_MAX = float(os.getenv("FD_FATIGUE_MAX", "0.06"))
 COMEBACK_TAKE = int(os.getenv("FD_COMEBACK_TAKE", "8"))
 COMEBACK_MAX = float(os.getenv("FD_COMEBACK_MAX", "0.03"))
 
+# نموذج الأشواط (HT/FT): حصة الشوط الأول من أهداف كل جهة، بانكماش نحو قيمة مسبقة
+HT_SHARE_PRIOR = float(os.getenv("FD_HT_SHARE_PRIOR", "0.45"))
+HT_SHARE_PRIOR_GOALS = float(os.getenv("FD_HT_SHARE_PRIOR_GOALS", "40"))  # وزن المسبق بعدد الأهداف
+
+# جلب مسبق متوازٍ لمدخلات predict_match
+PREFETCH_ENABLED = os.getenv("FD_PREFETCH", "1").strip().lower() in ("1", "true", "yes", "y")
+PREFETCH_WORKERS = int(os.getenv("FD_PREFETCH_WORKERS", "4"))
+PLAN_REQUEST_LATENCY_SEC = float(os.getenv("FD_PLAN_REQUEST_LATENCY_SEC", "0.5"))  # زمن شبكة تقديري لكل طلب (للتخطيط)
+
 # ===========================
 # أدوات مساعدة
 # ===========================
@@ -220,36 +281,647 @@ def ewma_weight(match_date_iso: str, ref_date_iso: str, half_life_days=HALF_LIFE
         return 1.0
     return 0.5 ** (age / half_life_days)
 
-def make_api_request(path, params=None, max_retries=4):
-    global _last_call_ts
-    url = f"{BASE_URL}{path}"
-    for attempt in range(max_retries):
+def ewma_weight_day(match_day: int, ref_day: int, half_life_days=HALF_LIFE_DAYS):
+    """ نفس ewma_weight لكن على ترتيب اليوم (MatchRec.day). """
+    if not match_day or not ref_day or half_life_days <= 0:
+        return 1.0
+    return 0.5 ** (max(0, ref_day - match_day) / half_life_days)
+
+# ===========================
+# محدد المعدل (Token Bucket)
+# ===========================
+def _header_int(headers, name):
+    try:
+        v = (headers or {}).get(name)
+        return int(str(v).strip()) if v is not None and str(v).strip().lstrip("-").isdigit() else None
+    except Exception:
+        return None
+
+class RateLimiter:
+    """
+    دلو توكنات: دفعات حرة طالما بقيت حصة، وتباطؤ فقط عند النفاد.
+    يُزامَن مع الخادم عبر X-Requests-Available-Minute / X-RequestCounter-Reset،
+    ويتعلّم حصة الخطط المدفوعة تلقائياً. per_minute <= 0 يعطّل التحديد.
+    """
+    def __init__(self, per_minute: float):
+        self.enabled = per_minute > 0
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.reset_at = None  # عند النفاد: لحظة تصفير عدّاد الخادم
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.reset_at is not None:
+            if now >= self.reset_at:
+                self.tokens = self.capacity
+                self.reset_at = None
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """ يأخذ توكناً إن توفّر ويعيد 0، وإلا يعيد زمن الانتظار المقترح بالثواني. """
+        if not self.enabled:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                self.inflight += 1
+                return 0.0
+            if self.reset_at is not None:
+                return max(0.01, self.reset_at - now)
+            return max(0.01, (1.0 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """ ينتظر حتى يتوفر توكن. يعيد زمن الانتظار الفعلي. """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return waited
+            wait += random.uniform(0, 0.25)
+            time.sleep(wait)
+            waited += wait
+
+    def release(self):
+        """ يُستدعى بعد انتهاء الطلب (نجح أو فشل). """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.inflight = max(0, self.inflight - 1)
+
+    def update_from_headers(self, headers):
+        """ الخادم هو المرجع: اضبط الرصيد من الترويسات (قبل release لنفس الطلب). """
+        if not self.enabled:
+            return
+        avail = _header_int(headers, "X-Requests-Available-Minute")
+        reset = _header_int(headers, "X-RequestCounter-Reset")
+        if avail is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if avail + 1 > self.capacity:
+                # خطة أعلى من المتوقع → وسّع السعة ومعدل التعبئة
+                self.capacity = float(avail + 1)
+                self.rate = self.capacity / 60.0
+            # الطلبات الأخرى الجارية لم تُحتسب بعد في رد الخادم
+            self.tokens = max(0.0, float(avail) - max(0, self.inflight - 1))
+            if self.tokens < 1.0:
+                self.reset_at = now + (reset if reset is not None and reset >= 0 else RATE_LIMIT_FALLBACK_WAIT)
+            else:
+                self.reset_at = None
+
+    def available(self):
+        """ الرصيد الحالي (بدون سحب). """
+        if not self.enabled:
+            return float("inf")
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def estimate_wait(self, n_calls: int):
+        """ تقدير زمن الانتظار (ثوانٍ) الذي سيفرضه المحدد على n_calls طلباً متتالياً من الآن. """
+        if not self.enabled or n_calls <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.reset_at is not None:
+                # لا رصيد حتى التصفير، ثم سعة كاملة ثم التعبئة التدريجية
+                extra = n_calls - int(self.capacity)
+                return max(0.0, self.reset_at - now) + max(0, extra) / self.rate
+            extra = n_calls - int(self.tokens)
+            return max(0, extra) / self.rate
+
+    def penalize(self, wait_sec: float):
+        """ بعد 429: صفّر الرصيد حتى موعد التصفير. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.tokens = 0.0
+            self.reset_at = time.monotonic() + max(0.0, float(wait_sec))
+            self.updated = time.monotonic()
+
+# ===========================
+# مجمّع مفاتيح API
+# ===========================
+def _mask_key(key: str) -> str:
+    return (key[:4] + "…" + key[-2:]) if key and len(key) > 8 else "****"
+
+class _ApiKeyState:
+    """ مفتاح واحد: محدد معدل خاص + عدادات الحصة + حالة الإيقاف (401/403). """
+    def __init__(self, key: str, per_minute: float):
+        self.key = key
+        self.limiter = RateLimiter(per_minute)
+        self.quarantined_until = 0.0
+        self.blocked_paths = {}  # path -> until (403: المورد غير متاح لخطة هذا المفتاح)
+        self.inflight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.denied = 0
+        self.last_available = None
+
+    def usable(self, now, path=None):
+        if self.quarantined_until > now:
+            return False
+        return path is None or self.blocked_paths.get(path, 0.0) <= now
+
+class ApiKeyPool:
+    """
+    يوزّع الطلبات على عدة مفاتيح: كل طلب يأخذ المفتاح الأكثر رصيداً،
+    فتتوزع الطلبات المستقلة على المفاتيح وتتضاعف الحصة الإجمالية بعددها.
+    """
+    def __init__(self, keys, per_minute: float):
+        self.states = [_ApiKeyState(k, per_minute) for k in keys]
+        self.enabled = per_minute > 0
+        self.lock = threading.Lock()
+
+    def _usable(self, path=None):
+        now = time.monotonic()
+        return [st for st in self.states if st.usable(now, path)]
+
+    def has_usable(self, path=None):
+        return bool(self._usable(path))
+
+    def has_other_usable(self, st: _ApiKeyState, path=None):
+        """ هل يوجد مفتاح صالح غير st لهذا المسار؟ """
+        return any(o is not st for o in self._usable(path))
+
+    def try_acquire(self, path=None):
+        """ يعيد (المفتاح، 0) إن توفّر توكن، وإلا (None، أقل زمن انتظار). يرمي إن لم يبق مفتاح صالح. """
+        cands = self._usable(path)
+        if not cands:
+            raise RuntimeError("رفض الوصول لكل مفاتيح API. تحقق من صحة FOOTBALL_DATA_API_KEY(S).")
+        cands.sort(key=lambda st: (-st.limiter.available(), st.inflight))
+        best_wait = None
+        for st in cands:
+            wait_sec = st.limiter.try_acquire()
+            if wait_sec <= 0:
+                with self.lock:
+                    st.inflight += 1
+                    st.requests += 1
+                return st, 0.0
+            best_wait = wait_sec if best_wait is None else min(best_wait, wait_sec)
+        return None, best_wait
+
+    def release(self, st: _ApiKeyState):
+        st.limiter.release()
+        with self.lock:
+            st.inflight = max(0, st.inflight - 1)
+
+    def record_response(self, st: _ApiKeyState, resp):
+        """ مزامنة محدد المفتاح مع ترويسات الخادم + عدادات الحصة (قبل release). """
+        st.limiter.update_from_headers(resp.headers)
+        avail = _header_int(resp.headers, "X-Requests-Available-Minute")
+        with self.lock:
+            if avail is not None:
+                st.last_available = avail
+            if resp.status_code == 429:
+                st.throttled += 1
+            elif resp.status_code in (401, 403):
+                st.denied += 1
+
+    def quarantine(self, st: _ApiKeyState, path: str = None, seconds: float = None):
+        """ path=None: إيقاف المفتاح كلياً (401)، وإلا إيقافه لهذا المسار فقط (403). """
+        until = time.monotonic() + (KEY_QUARANTINE_SEC if seconds is None else seconds)
+        with self.lock:
+            if path is None:
+                st.quarantined_until = until
+            else:
+                st.blocked_paths[path] = until
+
+    @property
+    def capacity(self):
+        return sum(st.limiter.capacity for st in self._usable())
+
+    def available(self):
+        if not self.enabled:
+            return float("inf")
+        return sum(st.limiter.available() for st in self._usable())
+
+    def estimate_wait(self, n_calls: int):
+        """ توزيع n_calls على المفاتيح بحيث يصغر أطول انتظار (جشع). """
+        usable = self._usable()
+        if not self.enabled or n_calls <= 0 or not usable:
+            return 0.0
+        assigned = [0] * len(usable)
+        worst = 0.0
+        for _ in range(n_calls):
+            waits = [st.limiter.estimate_wait(a + 1) for st, a in zip(usable, assigned)]
+            i = min(range(len(usable)), key=waits.__getitem__)
+            assigned[i] += 1
+            worst = max(worst, waits[i])
+        return worst
+
+    def stats(self):
+        """ لقطة العدادات لكل مفتاح (المفتاح مقنّع). """
+        now = time.monotonic()
+        with self.lock:
+            return [{
+                "key": _mask_key(st.key),
+                "requests": st.requests,
+                "throttled": st.throttled,
+                "denied": st.denied,
+                "available_minute": st.last_available,
+                "quarantined": st.quarantined_until > now,
+                "blocked_paths": sorted(p for p, t in st.blocked_paths.items() if t > now),
+            } for st in self.states]
+
+API_KEY_POOL = ApiKeyPool(API_KEYS, RATE_PER_MIN)
+
+def api_key_stats():
+    return API_KEY_POOL.stats()
+
+# ===========================
+# جدولة الطلبات حسب الأولوية
+# ===========================
+# الأصغر أهم: التوقع الذي ينتظره المستخدم يسبق كل شيء، والتسخين الخلفي يتنازل عن الحصة
+PRIORITY_INTERACTIVE = 0
+PRIORITY_MODEL = 1
+PRIORITY_ENRICHMENT = 2
+PRIORITY_BACKGROUND = 3
+
+_priority_ctx = threading.local()
+
+def current_request_priority():
+    return getattr(_priority_ctx, "level", PRIORITY_MODEL)
+
+@contextmanager
+def request_priority(level: int):
+    """ يضبط فئة أولوية طلبات API في هذا الخيط ضمن الكتلة. """
+    prev = current_request_priority()
+    _priority_ctx.level = level
+    if level == PRIORITY_INTERACTIVE:
+        REQUEST_SCHEDULER.interactive_enter()
+    try:
+        yield
+    finally:
+        if level == PRIORITY_INTERACTIVE:
+            REQUEST_SCHEDULER.interactive_exit()
+        _priority_ctx.level = prev
+
+def _at_most(level: int):
+    """ أولوية لا تتجاوز أهمية السياق الحالي (عمل ثانوي داخل توقع خلفي يبقى خلفياً). """
+    return request_priority(max(level, current_request_priority()))
+
+def with_request_priority(level: int):
+    """ مُزخرف: الدالة تعمل بفئة level (أو أقل أهمية إن كان السياق كذلك). """
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _at_most(level):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+class RequestScheduler:
+    """
+    طابور مركزي أمام المحدد: التوكن يذهب دائماً لأهم طالب (ثم الأقدم).
+    الطلبات الخلفية لا تأخذ آخر BACKGROUND_RESERVE توكنات ما دام هناك توقع تفاعلي جارٍ،
+    وتستأنف تلقائياً بعد انتهائه.
+    """
+    def __init__(self, pool: ApiKeyPool):
+        self.pool = pool
+        self.cond = threading.Condition()
+        self.waiters = []  # heap من التذاكر [priority, seq, key]
+        self.by_key = {}
+        self.seq = itertools.count()
+        self.interactive_active = 0
+
+    def interactive_enter(self):
+        with self.cond:
+            self.interactive_active += 1
+
+    def interactive_exit(self):
+        with self.cond:
+            self.interactive_active = max(0, self.interactive_active - 1)
+            self.cond.notify_all()
+
+    def _blocked_by_reserve(self, priority):
+        return (
+            priority >= PRIORITY_BACKGROUND and self.interactive_active > 0
+            and self.pool.available() < 1 + BACKGROUND_RESERVE
+        )
+
+    def acquire(self, priority: int = None, key: str = None, path: str = None):
+        """ ينتظر دوره ثم توكناً من أحد مفاتيح المجمّع. يعيد حالة المفتاح المختار. """
+        priority = current_request_priority() if priority is None else priority
+        if not self.pool.enabled:
+            return self.pool.try_acquire(path)[0]
+        ticket = [priority, next(self.seq), key]
+        with self.cond:
+            heapq.heappush(self.waiters, ticket)
+            if key is not None:
+                self.by_key[key] = ticket
+            try:
+                while True:
+                    wait_sec = 0.5
+                    if self.waiters[0] is ticket and not self._blocked_by_reserve(ticket[0]):
+                        st, wait_sec = self.pool.try_acquire(path)
+                        if st is not None:
+                            return st
+                    self.cond.wait(timeout=min(max(wait_sec, 0.01), 0.5))
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                if key is not None and self.by_key.get(key) is ticket:
+                    self.by_key.pop(key, None)
+                self.cond.notify_all()
+
+    def boost(self, key: str, priority: int):
+        """ طالب أهم ينتظر نفس الطلب (single-flight) → ارفع أولوية التذكرة المنتظرة. """
+        with self.cond:
+            ticket = self.by_key.get(key)
+            if ticket is not None and priority < ticket[0]:
+                ticket[0] = priority
+                heapq.heapify(self.waiters)
+                self.cond.notify_all()
+
+REQUEST_SCHEDULER = RequestScheduler(API_KEY_POOL)
+
+# ===========================
+# كاش دائم على القرص (SQLite)
+# ===========================
+# TTL لكل endpoint (أول تطابق يفوز)؛ نوافذ المباريات تُعالج في _disk_ttl_for
+DISK_TTL_RULES = [
+    (re.compile(r"^/competitions$"), TTL_COMPETITIONS),
+    (re.compile(r"^/competitions/\d+$"), TTL_COMPETITIONS),
+    (re.compile(r"^/competitions/\d+/teams$"), TTL_COMPETITIONS),
+    (re.compile(r"^/competitions/\d+/scorers$"), TTL_COMPETITIONS),
+    (re.compile(r"^/competitions/\d+/standings$"), TTL_STANDINGS),
+    (re.compile(r"^/teams/\d+$"), TTL_TEAMS),
+    (re.compile(r"^/matches$"), TTL_MATCHES),
+    (re.compile(r"^/competitions/\d+/matches$"), TTL_MATCHES),
+    (re.compile(r"^/teams/\d+/matches$"), TTL_MATCHES),
+]
+
+_db_conn = None
+_db_lock = threading.Lock()
+_db_failed = False
+
+def _get_db():
+    """
+    اتصال SQLite مشترك (كسول). يعيد None إن كان الكاش معطلاً أو تعذر فتحه،
+    أو عند تفعيل كاسيت HTTP (كي تمر كل الطلبات عبره ويبقى التشغيل حتمياً).
+    """
+    global _db_conn, _db_failed
+    if not DISK_CACHE_ENABLED or _db_failed or http_cassette.active() is not None:
+        return None
+    if _db_conn is not None:
+        return _db_conn
+    with _db_lock:
+        if _db_conn is not None:
+            return _db_conn
         try:
-            # احترم التباعد بين الطلبات
-            if _MIN_INTERVAL_SEC > 0:
-                with _last_call_lock:
-                    delta = time.time() - _last_call_ts
-                    if delta < _MIN_INTERVAL_SEC:
-                        time.sleep((_MIN_INTERVAL_SEC - delta) + random.uniform(0, 0.25))
+            d = os.path.dirname(DISK_CACHE_PATH)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            conn = sqlite3.connect(DISK_CACHE_PATH, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache ("
+                " key TEXT PRIMARY KEY, path TEXT NOT NULL, body TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS api_cache_path ON api_cache(path)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS match_store ("
+                " comp_id INTEGER NOT NULL, match_id INTEGER NOT NULL, utc_date TEXT, body TEXT NOT NULL,"
+                " PRIMARY KEY (comp_id, match_id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS match_store_sync ("
+                " comp_id INTEGER PRIMARY KEY, synced_from TEXT, synced_to TEXT, synced_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fit_cache ("
+                " comp_id INTEGER NOT NULL, season TEXT NOT NULL, as_of TEXT NOT NULL, hp TEXT NOT NULL,"
+                " body TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (comp_id, season, as_of, hp))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS elo_state ("
+                " comp_id INTEGER NOT NULL, season TEXT NOT NULL, body TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (comp_id, season))"
+            )
+            conn.commit()
+            _db_conn = conn
+        except Exception as e:
+            log(f"[{now_str()}] Disk cache disabled ({DISK_CACHE_PATH}): {e}")
+            _db_failed = True
+            return None
+    return _db_conn
+
+def _cache_key(path, params=None):
+    """ مفتاح ثابت: المسار + باراميترات مرتبة (بدون None) """
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+    if not items:
+        return path
+    return path + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+def _disk_ttl_for(path, params=None):
+    """
+    يعيد TTL بالثواني، أو None = للأبد.
+    نافذة FINISHED انتهى تاريخها (dateTo) قبل FINISHED_SETTLE_DAYS لا تتغير أبداً؛
+    بقية نوافذ المباريات لا يتجاوز TTL لها SYNC_MIN_INTERVAL_SEC.
+    """
+    params = params or {}
+    if path.endswith("/matches") or path == "/matches":
+        status = str(params.get("status") or "").upper()
+        d_to = parse_date_safe(str(params.get("dateTo") or ""))
+        if status == "FINISHED" and d_to and d_to < datetime.now().date() - timedelta(days=FINISHED_SETTLE_DAYS):
+            return None
+        # موسم (YYYY = سنة البداية) انتهى يقيناً قبل سنتين
+        season = str(params.get("season") or "")
+        if status == "FINISHED" and season.isdigit() and int(season) <= datetime.now().year - 2:
+            return None
+        # نافذة لم تستقر (حافة المزامنة): لا تُخدم من الكاش أقدم من فاصل إعادة المزامنة
+        # وإلا قد تعيد المزامنة التالية نسخة قديمة وتتأخر النتائج المنتهية حديثاً
+        ttl = next((t for rx, t in DISK_TTL_RULES if rx.match(path)), TTL_DEFAULT)
+        return min(ttl, SYNC_MIN_INTERVAL_SEC)
+    for rx, ttl in DISK_TTL_RULES:
+        if rx.match(path):
+            return ttl
+    return TTL_DEFAULT
+
+def _disk_cache_get(key):
+    conn = _get_db()
+    if conn is None:
+        return None
+    try:
+        with _db_lock:
+            row = conn.execute("SELECT body, expires_at FROM api_cache WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        body, exp = row
+        if exp is not None and time.time() > exp:
+            return None
+        return json.loads(body)
+    except Exception as e:
+        log(f"[{now_str()}] Disk cache read error: {e}")
+        return None
 
-            resp = SESSION.get(url, headers=HEADERS, params=params, timeout=20)
+def _disk_cache_set(key, path, data, ttl):
+    conn = _get_db()
+    if conn is None:
+        return
+    now = time.time()
+    exp = None if ttl is None else now + ttl
+    try:
+        with _db_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO api_cache (key, path, body, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, path, json.dumps(data, ensure_ascii=False), now, exp),
+            )
+            conn.commit()
+    except Exception as e:
+        log(f"[{now_str()}] Disk cache write error: {e}")
+
+def invalidate_api_cache(path_prefix: str = None, params: dict = None, expired_only: bool = False):
+    """
+    إبطال صريح للكاش الدائم.
+    - path_prefix + params: مفتاح واحد بعينه
+    - path_prefix وحده: كل المفاتيح التي تبدأ بهذا المسار (مثل "/competitions/2014")
+    - بدون شيء: كل الكاش (أو المنتهي فقط مع expired_only=True)
+    يعيد عدد الصفوف المحذوفة.
+    """
+    conn = _get_db()
+    if conn is None:
+        return 0
+    if path_prefix and params is not None:
+        sql, args = "DELETE FROM api_cache WHERE key = ?", [_cache_key(path_prefix, params)]
+    elif path_prefix:
+        sql, args = "DELETE FROM api_cache WHERE path = ? OR path LIKE ?", [path_prefix, path_prefix.rstrip("/") + "/%"]
+    else:
+        sql, args = "DELETE FROM api_cache WHERE 1 = 1", []
+    if expired_only:
+        sql += " AND expires_at IS NOT NULL AND expires_at < ?"
+        args.append(time.time())
+    with _db_lock:
+        cur = conn.execute(sql, args)
+        conn.commit()
+    return cur.rowcount
+
+# ===========================
+# وضع التخطيط (Dry-run): لا شبكة، فقط تسجيل ما سيُطلب
+# ===========================
+_plan_ctx = threading.local()
+
+class _PlanRecorder:
+    """ يسجّل كل (path, params) يمر عبر make_api_request في هذا الخيط، وهل هو مخزّن مسبقاً. """
+    def __init__(self):
+        self.requests = {}  # key -> {"path", "params", "cached"}
+        self.coverage = {}  # comp_id -> (from, to) تغطية المخزن بعد المزامنة المخطط لها
+
+    def note(self, path, params, cached: bool):
+        key = _cache_key(path, params)
+        if key not in self.requests:
+            self.requests[key] = {"path": path, "params": dict(params or {}), "cached": bool(cached)}
+
+def _plan_recorder():
+    return getattr(_plan_ctx, "recorder", None)
+
+def _endpoint_template(path: str):
+    return re.sub(r"/-?\d+", "/{id}", path)
+
+# طلبات جارية حالياً: مفتاح → Future مشترك (single-flight)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def make_api_request(path, params=None, max_retries=4, use_cache=True):
+    """
+    طلب GET إلى Football-Data مع كاش دائم على القرص.
+    - use_cache=False: تجاوز القراءة من الكاش (تُحدَّث النسخة المخزنة عند النجاح)
+    - الطلبات المتزامنة لنفس (path, params) تنتظر طلباً واحداً وتتشارك نتيجته (توكن واحد من المحدد)
+    """
+    key = _cache_key(path, params)
+    rec = _plan_recorder()
+    if rec is not None:
+        cached = _disk_cache_get(key) if use_cache else None
+        rec.note(path, params, cached is not None)
+        return cached
+    if use_cache:
+        cached = _disk_cache_get(key)
+        if cached is not None:
+            return cached
 
-            # حدّث وقت آخر طلب فوراً بعد التنفيذ
-            if _MIN_INTERVAL_SEC > 0:
-                with _last_call_lock:
-                    _last_call_ts = time.time()
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _inflight[key] = fut
+    if not leader:
+        REQUEST_SCHEDULER.boost(key, current_request_priority())
+        return fut.result()
 
-            # 429: نعالجها يدوياً
+    try:
+        # ربما أنهى طلبٌ آخر نفس المفتاح بين قراءة الكاش وتسجيلنا
+        data = _disk_cache_get(key) if use_cache else None
+        if data is None:
+            data = _http_get_json(path, params=params, max_retries=max_retries, queue_key=key)
+            if data is not None:
+                _disk_cache_set(key, path, data, _disk_ttl_for(path, params))
+        fut.set_result(data)
+        return data
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _http_get_json(path, params=None, max_retries=4, queue_key=None):
+    url = f"{BASE_URL}{path}"
+    cassette = http_cassette.active()
+    for attempt in range(max_retries):
+        key_state = None
+        try:
+            if cassette is not None and cassette.replaying:
+                # replay: بلا شبكة وبلا انتظار المحدد
+                resp = cassette.replay(url, params)
+                if resp.status_code == 429:
+                    continue
+            else:
+                # توكن من المحدد عبر طابور الأولويات: دفعة حرة طالما بقيت حصة
+                # المفتاح الأكثر رصيداً → الطلبات المستقلة تتوزع على المفاتيح
+                key_state = REQUEST_SCHEDULER.acquire(current_request_priority(), key=queue_key, path=path)
+                try:
+                    resp = SESSION.get(url, headers={**HEADERS, "X-Auth-Token": key_state.key}, params=params, timeout=20)
+                    API_KEY_POOL.record_response(key_state, resp)
+                finally:
+                    API_KEY_POOL.release(key_state)
+                if cassette is not None and cassette.recording:
+                    cassette.record(url, params, resp)
+
+            # 429: انتظر حتى تصفير العداد حسب الترويسات
             if resp.status_code == 429:
-                ra = resp.headers.get("Retry-After")
-                wait_sec = int(ra) if ra and str(ra).isdigit() else 60
-                remain = resp.headers.get("X-RateLimit-Remaining") or "?"
-                log(f"[{now_str()}] Rate limit hit (remain={remain}). Waiting {wait_sec}s...")
-                time.sleep(wait_sec)
+                ra = _header_int(resp.headers, "Retry-After")
+                rs = _header_int(resp.headers, "X-RequestCounter-Reset")
+                wait_sec = ra if ra is not None else (rs if rs is not None else RATE_LIMIT_FALLBACK_WAIT)
+                remain = resp.headers.get("X-Requests-Available-Minute") or resp.headers.get("X-RateLimit-Remaining") or "?"
+                if key_state is not None and key_state.limiter.enabled:
+                    # الطلب التالي يذهب لمفتاح آخر ما زال لديه رصيد (أو ينتظر المحدد حتى التصفير)
+                    key_state.limiter.penalize(wait_sec)
+                    log(f"[{now_str()}] Rate limit hit (remain={remain}) on key {_mask_key(key_state.key)}; paused {wait_sec}s, retrying via key pool.")
+                else:
+                    # لا محدد يفرض الانتظار → ننتظر هنا كما في السابق
+                    log(f"[{now_str()}] Rate limit hit (remain={remain}). Waiting {wait_sec}s...")
+                    time.sleep(wait_sec)
                 continue
 
-            # 401/403: مشاكل صلاحيات — ارمِ استثناء واضح
+            # 401/403: مشاكل صلاحيات — أوقف المفتاح وجرّب غيره، وارمِ استثناء واضح إن لم يبق مفتاح صالح
             if resp.status_code in (401, 403):
+                if key_state is not None and API_KEY_POOL.has_other_usable(key_state, path):
+                    # 401 = مفتاح غير صالح؛ 403 = المورد خارج خطة هذا المفتاح فقط
+                    API_KEY_POOL.quarantine(key_state, path=None if resp.status_code == 401 else path)
+                    log(f"[{now_str()}] API key {_mask_key(key_state.key)} denied (HTTP {resp.status_code}) for {path}; quarantined.")
+                    continue
                 raise RuntimeError(f"رفض الوصول (HTTP {resp.status_code}). تحقق من صحة FOOTBALL_DATA_API_KEY.")
 
             # 4xx أخرى (مثل 400): اطبع الرسالة وتوقّف (لا تعاود المحاولة)
@@ -287,6 +959,8 @@ class TTLCache:
             return None
         return value
     def set(self, key, value):
+        if _plan_recorder() is not None:
+            return  # لا نخزّن نتائج ناقصة من وضع التخطيط
         self.store[key] = (value, time.time() + self.ttl)
 
 COMPS_CACHE = TTLCache(TTL_COMPETITIONS)
@@ -541,7 +1215,7 @@ def get_team_details(team_id: int, force: bool = False):
         cached = TEAM_DETAILS_CACHE.get(key)
         if cached is not None:
             return cached
-    data = make_api_request(f"/teams/{team_id}")
+    data = make_api_request(f"/teams/{team_id}", use_cache=not force)
     if data and isinstance(data, dict) and data.get("id"):
         TEAM_DETAILS_CACHE.set(key, data)
         return data
@@ -657,6 +1331,47 @@ def _fetch_matches_by_competition_chunked(comp_id: int, date_from: str, date_to:
                 results[mid] = m
     return list(results.values())
 
+def _season_year_for_window(comp_id: int, date_from: str, date_to: str):
+    """ سنة بداية الموسم الذي يحتوي النافذة بالكامل (من currentSeason أو seasons)، أو None. """
+    info = get_competition_info(comp_id) or {}
+    seasons = [info.get("currentSeason") or {}] + list(info.get("seasons") or [])
+    for se in seasons:
+        s_start, s_end = se.get("startDate"), se.get("endDate")
+        if s_start and s_end and s_start <= date_from and date_to <= s_end:
+            try:
+                return int(s_start[:4])
+            except ValueError:
+                return None
+    return None
+
+def _fetch_matches_by_competition_season(comp_id: int, season: int, status: str = "FINISHED"):
+    """ موسم كامل بطلب واحد عبر /competitions/{id}/matches?season=YYYY. يعيد None عند الفشل. """
+    data = make_api_request(f"/competitions/{comp_id}/matches", params={"season": season, "status": status})
+    if not data or "matches" not in data:
+        return None
+    return [m for m in data.get("matches", []) if m.get("id") is not None]
+
+def _fetch_matches_by_competition_bulk(comp_id: int, date_from: str, date_to: str, status: str = "FINISHED"):
+    """
+    يفضّل مسار الموسم الكامل (طلب واحد) إن وقعت النافذة داخل موسم معروف وكانت أطول من شريحة واحدة؛
+    وإلا (أو عند الفشل) يرجع إلى التقسيم على /matches.
+    """
+    d1, d2 = parse_date_safe(date_from), parse_date_safe(date_to)
+    span = (d2 - d1).days + 1 if d1 and d2 else 0
+    if SEASON_BULK and span > min(MATCHES_CHUNK_DAYS, 10):
+        season = _season_year_for_window(comp_id, date_from, date_to)
+        rec = _plan_recorder()
+        if season is None and rec is not None:
+            # التخطيط دون معلومات موسم مخزّنة: الجلب الفعلي سيعرفها أولاً ثم يطلب الموسم كاملاً
+            rec.note(f"/competitions/{comp_id}/matches", {"season": "?", "status": status}, False)
+            return []
+        if season is not None:
+            matches = _fetch_matches_by_competition_season(comp_id, season, status=status)
+            if matches is not None or rec is not None:
+                return matches or []
+            log(f"[{now_str()}] Season bulk fetch unavailable for comp={comp_id} season={season}; falling back to chunks")
+    return _fetch_matches_by_competition_chunked(comp_id, date_from, date_to, status=status)
+
 def _fetch_team_matches_chunked(team_id: int, comp_id: int, date_from: str, date_to: str, status: str = "FINISHED"):
     results = {}
     for df, dt in chunked_date_ranges(date_from, date_to, TEAM_MATCHES_CHUNK_DAYS, MAX_CHUNKS):
@@ -683,47 +1398,378 @@ def _fetch_team_matches_any_comp_chunked(team_id: int, date_from: str, date_to:
                 results[mid] = m
     return list(results.values())
 
-@lru_cache(maxsize=32)
+# ===========================
+# سجل مباراة مختصر (يُسقَط مرة واحدة عند الاستلام)
+# ===========================
+# day: ترتيب اليوم (date.toordinal) | ts: ثواني UTC منذ نفس الأصل (للفرز) | hht/aht: أهداف الشوط الأول (None إن غابت)
+MatchRec = namedtuple("MatchRec", "id day ts home away hg ag hht aht status matchday comp")
+
+def _utc_day_ts(utc: str):
+    s = utc or ""
+    for fmt, n in (("%Y-%m-%dT%H:%M:%S", 19), ("%Y-%m-%d", 10)):
+        try:
+            d = datetime.strptime(s[:n], fmt)
+        except ValueError:
+            continue
+        day = d.toordinal()
+        return day, day * 86400 + d.hour * 3600 + d.minute * 60 + d.second
+    return 0, 0
+
+def _iso_day(d_iso: str):
+    d = parse_date_safe(d_iso)
+    return d.toordinal() if d else None
+
+def project_match(m, comp_id: int = None):
+    """ يحوّل قاموس مباراة خام من API إلى MatchRec (الحقول التي تستخدمها النماذج فقط). """
+    if isinstance(m, MatchRec):
+        return m
+    score = m.get("score") or {}
+    ft = score.get("fullTime") or {}
+    ht = score.get("halfTime") or {}
+    day, ts = _utc_day_ts(m.get("utcDate"))
+    return MatchRec(
+        m.get("id"), day, ts,
+        (m.get("homeTeam") or {}).get("id"), (m.get("awayTeam") or {}).get("id"),
+        ft.get("home") or 0, ft.get("away") or 0, ht.get("home"), ht.get("away"),
+        sys.intern(m.get("status") or ""), m.get("matchday"),
+        (m.get("competition") or {}).get("id") or comp_id,
+    )
+
+# ===========================
+# مخزن عمودي (NumPy) لحسابات النماذج
+# ===========================
+class MatchArrays:
+    """
+    مباريات نافذة واحدة كأعمدة NumPy مرتبة زمنياً (ts ثم id)، مع ربط كثيف team_id ↔ index.
+    home/away فهارس في team_ids؛ hht/aht = -1 عند غياب نتيجة الشوط الأول؛ w = وزن EWMA حتى ref_day.
+    """
+    def __init__(self, recs, ref_day: int = None, half_life_days=HALF_LIFE_DAYS):
+        recs = [m for m in recs if m.home and m.away]
+        self.team_ids = np.array(sorted({m.home for m in recs} | {m.away for m in recs}), dtype=np.int64)
+        self.index = {int(t): i for i, t in enumerate(self.team_ids)}
+        self.ids = np.array([m.id for m in recs], dtype=np.int64)
+        self.home = np.array([self.index[m.home] for m in recs], dtype=np.int32)
+        self.away = np.array([self.index[m.away] for m in recs], dtype=np.int32)
+        self.hg = np.array([m.hg for m in recs], dtype=np.int32)
+        self.ag = np.array([m.ag for m in recs], dtype=np.int32)
+        self.hht = np.array([-1 if m.hht is None else m.hht for m in recs], dtype=np.int32)
+        self.aht = np.array([-1 if m.aht is None else m.aht for m in recs], dtype=np.int32)
+        self.day = np.array([m.day for m in recs], dtype=np.int32)
+        self.ts = np.array([m.ts for m in recs], dtype=np.int64)
+        self.w = self.weights(ref_day, half_life_days)
+        self._team_pos = {}  # side -> (مواقع مرتبة حسب الفريق ثم الزمن, إزاحات لكل فريق)
+        self._digest = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_teams(self):
+        return len(self.team_ids)
+
+    def weights(self, ref_day: int = None, half_life_days=HALF_LIFE_DAYS):
+        """ نفس ewma_weight_day لكن لكل الأعمدة دفعة واحدة. """
+        if not ref_day or half_life_days <= 0:
+            return np.ones(len(self.ids))
+        age = np.maximum(0, ref_day - self.day)
+        return np.where(self.day > 0, 0.5 ** (age / half_life_days), 1.0)
+
+    def vector(self, values: dict, default: float = 1.0):
+        """ قاموس team_id → قيمة إلى متجه محاذٍ لـ team_ids. """
+        return np.array([values.get(int(t), default) for t in self.team_ids], dtype=float)
+
+    def digest(self):
+        """ بصمة البيانات (الفرق/النتائج/التواريخ) — تتغير مع أي نتيجة متأخرة أو مصححة. """
+        if self._digest is None:
+            h = hashlib.sha1()
+            for col in (self.ids, self.team_ids[self.home], self.team_ids[self.away], self.hg, self.ag, self.day):
+                h.update(np.ascontiguousarray(col).tobytes())
+            self._digest = h.hexdigest()[:20]
+        return self._digest
+
+    def to_dict(self, vec):
+        return {int(t): float(v) for t, v in zip(self.team_ids, vec)}
+
+    def _positions_index(self, side: str = None):
+        idx = self._team_pos.get(side)
+        if idx is None:
+            pos = np.arange(len(self.ids))
+            if side == "H":
+                teams, pos = self.home, pos
+            elif side == "A":
+                teams, pos = self.away, pos
+            else:
+                teams, pos = np.concatenate([self.home, self.away]), np.concatenate([pos, pos])
+            order = np.lexsort((pos, teams))
+            offsets = np.searchsorted(teams[order], np.arange(self.n_teams + 1))
+            idx = self._team_pos[side] = (pos[order], offsets)
+        return idx
+
+    def team_positions(self, team_id: int, side: str = None):
+        """ مواقع مباريات الفريق (side = "H" / "A" / None) مرتبة زمنياً — شريحة من فهرس يُبنى مرة واحدة. """
+        i = self.index.get(team_id)
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        pos, offsets = self._positions_index(side)
+        return pos[offsets[i]:offsets[i + 1]]
+
+    def recent_positions(self, team_id: int, side: str = None, take: int = None, until_day: int = None):
+        """ آخر take مباراة للفريق حتى until_day (شامل) بالبحث الثنائي بدل المسح. """
+        pos = self.team_positions(team_id, side)
+        if until_day is not None:
+            pos = pos[:np.searchsorted(self.day[pos], until_day, side="right")]
+        if take is not None:
+            pos = pos[-take:] if take > 0 else pos[:0]
+        return pos
+
+    def count_between(self, team_id: int, day_from: int, day_to: int, side: str = None):
+        """ عدد مباريات الفريق في [day_from, day_to] عبر bisect. """
+        days = self.day[self.team_positions(team_id, side)]
+        return int(np.searchsorted(days, day_to, side="right") - np.searchsorted(days, day_from, side="left"))
+
+def as_match_arrays(matches, ref_day: int = None):
+    """ يقبل MatchArrays جاهزة أو قائمة MatchRec/قواميس خام. """
+    if isinstance(matches, MatchArrays):
+        return matches
+    return MatchArrays([project_match(m) for m in matches or []], ref_day=ref_day)
+
+# ===========================
+# مخزن مباريات المسابقة (مزامنة تزايدية بـ watermark)
+# ===========================
+def _shift_iso(d_iso: str, days: int):
+    d = parse_date_safe(d_iso)
+    return (d + timedelta(days=days)).isoformat() if d else d_iso
+
+def _uncovered_windows(cov_from, cov_to, date_from: str, date_to: str):
+    if not cov_from or not cov_to:
+        return [(date_from, date_to)]
+    gaps = []
+    if date_from < cov_from:
+        gaps.append((date_from, min(date_to, _shift_iso(cov_from, -1))))
+    if date_to > cov_to:
+        gaps.append((max(date_from, _shift_iso(cov_to, 1)), date_to))
+    return gaps
+
+class CompetitionMatchStore:
+    """
+    مباريات FINISHED لمسابقة واحدة (كسجلات MatchRec) مدموجة حسب id، مع نطاق مُزامَن متصل [synced_from, synced_to].
+    synced_to هو الـ watermark: كل تحديث يجلب فقط ما بعده (مع تداخل قصير).
+    """
+    def __init__(self, comp_id: int):
+        self.comp_id = comp_id
+        self.matches = {}  # id -> MatchRec
+        self.by_team = {}  # team_id -> set(match_id)
+        self.synced_from = None
+        self.synced_to = None
+        self.synced_at = 0.0
+        self.version = 0  # يزيد مع كل تغيير → يبطل المصفوفات المخزنة
+        self._arrays = {}
+        self._team_sorted = {}  # team_id -> (أيام مرتبة, سجلات مرتبة) لـ bisect
+        self.lock = threading.RLock()
+
+    def merge(self, matches):
+        """ دمج حسب id (الأحدث يفوز) بعد الإسقاط إلى MatchRec. يعيد السجلات الجديدة/المتغيرة. """
+        changed = []
+        for m in matches or []:
+            m = project_match(m, self.comp_id)
+            if m.id is None:
+                continue
+            if self.matches.get(m.id) != m:
+                self.matches[m.id] = m
+                changed.append(m)
+                for tid in (m.home, m.away):
+                    if tid is not None:
+                        self.by_team.setdefault(tid, set()).add(m.id)
+        if changed:
+            self.version += 1
+            self._arrays.clear()
+            self._team_sorted.clear()
+        return changed
+
+    def covers(self, date_from: str, date_to: str):
+        return bool(self.synced_from and self.synced_to and self.synced_from <= date_from and date_to <= self.synced_to)
+
+    def uncovered(self, date_from: str, date_to: str):
+        """ النوافذ من [date_from, date_to] التي لم يُزامنها المخزن بعد. """
+        cov_from, cov_to = self.synced_from, self.synced_to
+        rec = _plan_recorder()
+        if rec is not None and self.comp_id in rec.coverage:
+            cov_from, cov_to = rec.coverage[self.comp_id]
+        return _uncovered_windows(cov_from, cov_to, date_from, date_to)
+
+    def team_between(self, team_id: int, date_from: str, date_to: str):
+        """ مباريات الفريق في النافذة مرتبة زمنياً: bisect على فهرس الفريق بدل مسح كل مبارياته. """
+        idx = self._team_sorted.get(team_id)
+        if idx is None:
+            recs = sorted((self.matches[mid] for mid in self.by_team.get(team_id, ())), key=lambda x: (x.ts, x.id))
+            idx = self._team_sorted[team_id] = ([m.day for m in recs], recs)
+        days, recs = idx
+        return recs[bisect.bisect_left(days, _iso_day(date_from)):bisect.bisect_right(days, _iso_day(date_to))]
+
+    def between(self, date_from: str, date_to: str):
+        d1, d2 = _iso_day(date_from), _iso_day(date_to)
+        out = [m for m in self.matches.values() if d1 <= m.day <= d2]
+        out.sort(key=lambda x: (x.ts, x.id))
+        return out
+
+    def arrays(self, date_from: str, date_to: str):
+        """ MatchArrays للنافذة (وزن EWMA حتى date_to)، تُبنى مرة لكل نسخة من المخزن. """
+        key = (date_from, date_to)
+        arr = self._arrays.get(key)
+        if arr is None:
+            arr = self._arrays[key] = MatchArrays(self.between(date_from, date_to), ref_day=_iso_day(date_to))
+        return arr
+
+    def load(self):
+        """ تحميل الحالة المحفوظة على القرص (إن وجدت). """
+        conn = _get_db()
+        if conn is None:
+            return
+        with _db_lock:
+            row = conn.execute(
+                "SELECT synced_from, synced_to, synced_at FROM match_store_sync WHERE comp_id = ?", (self.comp_id,)
+            ).fetchone()
+            if not row or (row[2] or 0.0) <= self.synced_at:
+                return
+            bodies = conn.execute("SELECT body FROM match_store WHERE comp_id = ?", (self.comp_id,)).fetchall()
+        # صفوف قديمة تحمل القاموس الخام → تُسقَط؛ الجديدة قائمة حقول MatchRec
+        recs = (json.loads(b) for (b,) in bodies)
+        self.merge(r if isinstance(r, dict) else MatchRec(*r) for r in recs)
+        self.synced_from, self.synced_to, self.synced_at = row[0], row[1], row[2] or 0.0
+
+    def save(self, changed):
+        conn = _get_db()
+        if conn is None:
+            return
+        try:
+            with _db_lock:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO match_store (comp_id, match_id, utc_date, body) VALUES (?, ?, ?, ?)",
+                    [(self.comp_id, m.id, date.fromordinal(m.day).isoformat() if m.day else None, json.dumps(list(m))) for m in changed],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO match_store_sync (comp_id, synced_from, synced_to, synced_at) VALUES (?, ?, ?, ?)",
+                    (self.comp_id, self.synced_from, self.synced_to, self.synced_at),
+                )
+                conn.commit()
+        except Exception as e:
+            log(f"[{now_str()}] Match store write error: {e}")
+
+_MATCH_STORES = {}
+_match_stores_lock = threading.Lock()
+
+def get_match_store(comp_id: int):
+    with _match_stores_lock:
+        store = _MATCH_STORES.get(comp_id)
+        if store is None:
+            store = _MATCH_STORES[comp_id] = CompetitionMatchStore(comp_id)
+    return store
+
+def sync_competition_matches(comp_id: int, date_from: str, date_to: str):
+    """
+    يضمن أن المخزن يغطي [date_from, date_to]:
+    - يجلب فقط النوافذ غير المغطاة (قبل synced_from / بعد watermark - تداخل)
+    - يعيد مزامنة الحافة الحديثة إن مرّ SYNC_MIN_INTERVAL_SEC (نتائج متأخرة)
+    """
+    df, dt = normalize_date_range(date_from, date_to)
+    store = get_match_store(comp_id)
+    with store.lock:
+        store.load()
+        windows = []
+        refresh_edge = False
+        if not store.synced_from or not store.synced_to:
+            windows.append((df, dt))
+            refresh_edge = True
+        else:
+            if df < store.synced_from:
+                windows.append((df, _shift_iso(store.synced_from, -1)))
+            edge_from = _shift_iso(min(store.synced_to, datetime.now().date().isoformat()), -SYNC_OVERLAP_DAYS)
+            stale = (time.time() - store.synced_at) > SYNC_MIN_INTERVAL_SEC
+            if dt > store.synced_to or (dt >= edge_from and stale):
+                windows.append((max(edge_from, store.synced_from), max(dt, store.synced_to)))
+                refresh_edge = True
+        if not windows:
+            return store
+
+        rec = _plan_recorder()
+        if rec is not None:
+            # وضع التخطيط: سجّل الطلبات وافترض التغطية دون لمس المخزن
+            for w_from, w_to in windows:
+                _fetch_matches_by_competition_bulk(comp_id, w_from, w_to, status="FINISHED")
+            rec.coverage[comp_id] = (min(df, store.synced_from or df), max(dt, store.synced_to or dt))
+            return store
+
+        changed = []
+        for w_from, w_to in windows:
+            changed.extend(store.merge(_fetch_matches_by_competition_bulk(comp_id, w_from, w_to, status="FINISHED")))
+        store.synced_from = min(df, store.synced_from or df)
+        store.synced_to = max(dt, store.synced_to or dt)
+        if refresh_edge:
+            store.synced_at = time.time()
+        store.save(changed)
+    return store
+
+def invalidate_match_store(comp_id: int = None):
+    """ يمسح مخزن المباريات (لمسابقة واحدة أو للجميع) من الذاكرة والقرص. """
+    with _match_stores_lock:
+        if comp_id is None:
+            _MATCH_STORES.clear()
+        else:
+            _MATCH_STORES.pop(comp_id, None)
+    _reset_global_elo()
+    conn = _get_db()
+    if conn is None:
+        return
+    with _db_lock:
+        if comp_id is None:
+            conn.execute("DELETE FROM match_store")
+            conn.execute("DELETE FROM match_store_sync")
+        else:
+            conn.execute("DELETE FROM match_store WHERE comp_id = ?", (comp_id,))
+            conn.execute("DELETE FROM match_store_sync WHERE comp_id = ?", (comp_id,))
+        conn.commit()
+
 def get_competition_matches(comp_id: int, date_from: str, date_to: str):
     df, dt = normalize_date_range(date_from, date_to)
-    return _fetch_matches_by_competition_chunked(comp_id, df, dt, status="FINISHED")
+    return sync_competition_matches(comp_id, df, dt).between(df, dt)
+
+def get_competition_arrays(comp_id: int, date_from: str, date_to: str):
+    df, dt = normalize_date_range(date_from, date_to)
+    store = sync_competition_matches(comp_id, df, dt)
+    with store.lock:
+        return store.arrays(df, dt)
 
 def get_team_matches_in_comp(team_id: int, comp_id: int, date_from: str, date_to: str):
+    """
+    مباريات الفريق في المسابقة من مخزن المسابقة المحلي (مرتبة زمنياً تصاعدياً)؛
+    الشبكة فقط للنوافذ التي لا يغطيها المخزن (مثل الموسم السابق في H2H).
+    """
     df, dt = normalize_date_range(date_from, date_to)
-    return _fetch_team_matches_chunked(team_id, comp_id, df, dt, status="FINISHED")
+    store = get_match_store(comp_id)
+    with store.lock:
+        store.load()
+        results = {m.id: m for m in store.team_between(team_id, df, dt)}
+        gaps = store.uncovered(df, dt)
+    for g_from, g_to in gaps:
+        for m in _fetch_team_matches_chunked(team_id, comp_id, g_from, g_to, status="FINISHED"):
+            results.setdefault(m["id"], project_match(m, comp_id))
+    out = list(results.values())
+    if gaps:
+        out.sort(key=lambda x: (x.ts, x.id))
+    return out
 
 def get_h2h_matches(team1_id: int, team2_id: int, comp_id: int, since: str):
     today_str = datetime.now().strftime("%Y-%m-%d")
     df, dt = normalize_date_range(since, today_str)
-    matches = _fetch_team_matches_chunked(team1_id, comp_id, df, dt, status="FINISHED")
-    h2h = []
-    for m in matches:
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
-        if h == team2_id or a == team2_id:
-            h2h.append(m)
-    h2h.sort(key=lambda x: x.get("utcDate", ""), reverse=True)
-    return h2h
-
-def parse_score(match):
-    score = match.get("score", {}).get("fullTime", {})
-    hg = score.get("home", 0) or 0
-    ag = score.get("away", 0) or 0
-    return hg, ag
+    matches = get_team_matches_in_comp(team1_id, comp_id, df, dt)
+    return [m for m in reversed(matches) if m.home == team2_id or m.away == team2_id]
 
 # ===========================
 # متوسطات الدوري وقوى الفرق
 # ===========================
 def calc_league_averages(comp_id: int, date_from: str, date_to: str):
-    matches = get_competition_matches(comp_id, date_from, date_to)
-    hg_sum, ag_sum, cnt = 0, 0, 0
-    for m in matches:
-        hg, ag = parse_score(m)
-        if hg is None or ag is None:
-            continue
-        hg_sum += hg
-        ag_sum += ag
-        cnt += 1
+    arr = get_competition_arrays(comp_id, date_from, date_to)
+    hg_sum, ag_sum, cnt = int(arr.hg.sum()), int(arr.ag.sum()), len(arr)
     if cnt == 0:
         return {
             "avg_home_goals": 1.4,
@@ -740,229 +1786,433 @@ def calc_league_averages(comp_id: int, date_from: str, date_to: str):
         "matches_count": cnt,
     }
 
-def build_iterative_team_factors(comp_id: int, date_from: str, date_to: str, league_avgs: dict, iters: int = 8):
-    matches = get_competition_matches(comp_id, date_from, date_to)
-    if not matches:
-        return {}, {}, matches
-    team_ids = set()
-    for m in matches:
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
-        if h:
-            team_ids.add(h)
-        if a:
-            team_ids.add(a)
-
-    A = {tid: 1.0 for tid in team_ids}  # هجوم
-    D = {tid: 1.0 for tid in team_ids}  # دفاع
-
-    matches_simple = []
-    for m in matches:
-        hg, ag = parse_score(m)
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
-        d_iso = (m.get("utcDate", "") or "")[:10]
-        w = ewma_weight(d_iso, date_to, HALF_LIFE_DAYS)
-        if h and a:
-            matches_simple.append({"h": h, "a": a, "hg": hg, "ag": ag, "w": w, "date": d_iso})
-
-    if not matches_simple:
-        return A, D, matches
-
-    # (1) احصِ عدد مباريات كل فريق (للانكماش المبكر)
-    match_counts = {tid: 0 for tid in team_ids}
-    for m in matches_simple:
-        match_counts[m["h"]] += 1
-        match_counts[m["a"]] += 1
-
-    prior_w = PRIOR_GAMES
-    avg_home = league_avgs["avg_home_goals"]
-    avg_away = league_avgs["avg_away_goals"]
+def fit_half_shares(arr: MatchArrays, prior: float = HT_SHARE_PRIOR, prior_goals: float = HT_SHARE_PRIOR_GOALS):
+    """
+    حصة الشوط الأول من أهداف المضيف والضيف (موزونة بـ EWMA) من المباريات التي لها نتيجة شوط أول،
+    مع انكماش نحو prior بوزن prior_goals هدفاً. الشوط الثاني = 1 − الحصة.
+    """
+    ok = (arr.hht >= 0) & (arr.aht >= 0) & (arr.hht <= arr.hg) & (arr.aht <= arr.ag)
+    w = arr.w[ok]
+    out = {"n": int(ok.sum())}
+    for side, ht, ft in (("home", arr.hht, arr.hg), ("away", arr.aht, arr.ag)):
+        share = (float(np.dot(w, ht[ok])) + prior * prior_goals) / (float(np.dot(w, ft[ok])) + prior_goals)
+        out[side] = clamp(share, 0.2, 0.8)
+    return out
+
+def get_half_shares(comp_id: int, date_from: str, date_to: str):
+    return fit_half_shares(get_competition_arrays(comp_id, date_from, date_to))
 
-    for _ in range(iters):
+def price_htft_board(fixtures, date_from: str, date_to: str, max_goals: int = None):
+    """
+    أسواق الأشواط للوحة أودز كاملة باستدعاء واحد.
+    fixtures: قواميس {"comp_id", "lam_home", "lam_away"} (أو "share_home"/"share_away" جاهزة).
+    الحصص تُلاءم مرة لكل مسابقة؛ المخرجات متجهات محاذية لترتيب fixtures.
+    """
+    shares = {}
+    lh, la, sh, sa = [], [], [], []
+    for fx in fixtures or []:
+        cid = fx.get("comp_id")
+        if "share_home" in fx and "share_away" in fx:
+            s_h, s_a = fx["share_home"], fx["share_away"]
+        else:
+            if cid not in shares:
+                shares[cid] = get_half_shares(cid, date_from, date_to) if cid else {"home": HT_SHARE_PRIOR, "away": HT_SHARE_PRIOR}
+            s_h, s_a = shares[cid]["home"], shares[cid]["away"]
+        lh.append(fx["lam_home"]); la.append(fx["lam_away"]); sh.append(s_h); sa.append(s_a)
+    if not lh:
+        return {}
+    return scoreline_engine.htft_markets(lh, la, sh, sa, max_goals)
+
+def solve_team_strengths(arr: MatchArrays, avg_home: float, avg_away: float, prior_w: float = PRIOR_GAMES, iters: int = AD_MAX_ITERS, tol: float = AD_TOL, init=None):
+    """
+    حلّ Maher/Poisson لقوى الهجوم A والدفاع D على الأعمدة (تجميع موزون بـ bincount).
+    نفس تحديث الحلقة القديمة: A ثم D بقيم A الجديدة، قصّ AD_CLAMP_*، ثم تطبيع المتوسط إلى 1.
+    init = (A0، D0) لبدء دافئ. يعيد (A، D، عدد التكرارات) كمتجهات محاذية لـ arr.team_ids.
+    """
+    n = arr.n_teams
+    h, a, w = arr.home, arr.away, arr.w
+    hg, ag = arr.hg.astype(float), arr.ag.astype(float)
+    # المقام لا يتغير بين التكرارات: prior + مجموع أوزان مباريات الفريق
+    den = prior_w + np.bincount(h, weights=w, minlength=n) + np.bincount(a, weights=w, minlength=n)
+    A, D = (np.array(init[0], dtype=float), np.array(init[1], dtype=float)) if init is not None else (np.ones(n), np.ones(n))
+    it = 0
+    for it in range(1, max(1, iters) + 1):
         # تحديث A
-        newA = {}
-        for i in team_ids:
-            num = prior_w * 1.0
-            den = prior_w * 1.0
-            for m in matches_simple:
-                if m["h"] == i:
-                    base = max(1e-6, avg_home * D[m["a"]])
-                    num += m["w"] * (m["hg"] / base)
-                    den += m["w"]
-                elif m["a"] == i:
-                    base = max(1e-6, avg_away * D[m["h"]])
-                    num += m["w"] * (m["ag"] / base)
-                    den += m["w"]
-            newA[i] = clamp(num / den, AD_CLAMP_MIN, AD_CLAMP_MAX)
-        A = newA
+        num = prior_w + np.bincount(h, weights=w * hg / np.maximum(1e-6, avg_home * D[a]), minlength=n) \
+            + np.bincount(a, weights=w * ag / np.maximum(1e-6, avg_away * D[h]), minlength=n)
+        newA = np.clip(num / den, AD_CLAMP_MIN, AD_CLAMP_MAX)
 
         # تحديث D (قابلية الاستقبال)
-        newD = {}
-        for i in team_ids:
-            num = prior_w * 1.0
-            den = prior_w * 1.0
-            for m in matches_simple:
-                if m["h"] == i:
-                    base = max(1e-6, avg_away * A[m["a"]])
-                    num += m["w"] * (m["ag"] / base)
-                    den += m["w"]
-                elif m["a"] == i:
-                    base = max(1e-6, avg_home * A[m["h"]])
-                    num += m["w"] * (m["hg"] / base)
-                    den += m["w"]
-            newD[i] = clamp(num / den, AD_CLAMP_MIN, AD_CLAMP_MAX)
-        D = newD
+        num = prior_w + np.bincount(h, weights=w * ag / np.maximum(1e-6, avg_away * newA[a]), minlength=n) \
+            + np.bincount(a, weights=w * hg / np.maximum(1e-6, avg_home * newA[h]), minlength=n)
+        newD = np.clip(num / den, AD_CLAMP_MIN, AD_CLAMP_MAX)
 
         # إعادة تطبيع
-        meanA = sum(A.values()) / len(A) if A else 1.0
-        meanD = sum(D.values()) / len(D) if D else 1.0
+        meanA, meanD = newA.mean(), newD.mean()
         if meanA > 0:
-            for k in A:
-                A[k] /= meanA
+            newA /= meanA
         if meanD > 0:
-            for k in D:
-                D[k] /= meanD
+            newD /= meanD
+
+        delta = max(np.abs(newA - A).max(), np.abs(newD - D).max())
+        A, D = newA, newD
+        if delta < tol:
+            break
+    return A, D, it
+
+# ===========================
+# كاش ملاءمة A/D (مفتاح: مسابقة، موسم، تاريخ as-of، المعاملات)
+# ===========================
+_FIT_MEM = {}  # (comp_id, season, as_of, hp) -> body
+_FIT_MEM_MAX = 64
+_fit_lock = threading.Lock()
+
+def _fit_hp_key(iters: int, tol: float):
+    return json.dumps([PRIOR_GAMES, HALF_LIFE_DAYS, AD_CLAMP_MIN, AD_CLAMP_MAX, iters, tol])
+
+def _fit_cache_lookup(comp_id: int, season: str, as_of: str, hp: str):
+    """ يعيد (ملاءمة as_of نفسها أو None، أقرب ملاءمة سابقة أو حتى نفس اليوم للبدء الدافئ). """
+    key = (comp_id, season, as_of, hp)
+    with _fit_lock:
+        exact = _FIT_MEM.get(key)
+        mem_prev = [k for k in _FIT_MEM if k[:2] == key[:2] and k[3] == hp and k[2] <= as_of]
+        nearest = _FIT_MEM[max(mem_prev, key=lambda k: k[2])] if mem_prev else None
+    if exact is not None:
+        return exact, exact
+    conn = _get_db()
+    if conn is None:
+        return None, nearest
+    try:
+        with _db_lock:
+            row = conn.execute(
+                "SELECT as_of, body FROM fit_cache WHERE comp_id = ? AND season = ? AND hp = ? AND as_of <= ?"
+                " ORDER BY as_of DESC LIMIT 1",
+                (comp_id, season, hp, as_of),
+            ).fetchone()
+    except Exception as e:
+        log(f"[{now_str()}] Fit cache read error: {e}")
+        return None, nearest
+    if not row:
+        return None, nearest
+    body = json.loads(row[1])
+    if row[0] == as_of:
+        _fit_cache_remember(key, body)
+        return body, body
+    return None, body
+
+def _fit_cache_remember(key, body):
+    with _fit_lock:
+        _FIT_MEM[key] = body
+        while len(_FIT_MEM) > _FIT_MEM_MAX:
+            _FIT_MEM.pop(next(iter(_FIT_MEM)))
+
+def _fit_cache_store(comp_id: int, season: str, as_of: str, hp: str, body: dict):
+    _fit_cache_remember((comp_id, season, as_of, hp), body)
+    conn = _get_db()
+    if conn is None:
+        return
+    try:
+        with _db_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO fit_cache (comp_id, season, as_of, hp, body, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (comp_id, season, as_of, hp, json.dumps(body), time.time()),
+            )
+            conn.commit()
+    except Exception as e:
+        log(f"[{now_str()}] Fit cache write error: {e}")
+
+def invalidate_fit_cache(comp_id: int = None):
+    """ يمسح ملاءمات A/D المخزنة (لمسابقة واحدة أو للجميع). """
+    with _fit_lock:
+        for k in [k for k in _FIT_MEM if comp_id is None or k[0] == comp_id]:
+            _FIT_MEM.pop(k, None)
+    conn = _get_db()
+    if conn is None:
+        return
+    with _db_lock:
+        if comp_id is None:
+            conn.execute("DELETE FROM fit_cache")
+        else:
+            conn.execute("DELETE FROM fit_cache WHERE comp_id = ?", (comp_id,))
+        conn.commit()
+
+def fit_team_strengths_cached(comp_id: int, season: str, as_of: str, arr: MatchArrays, avg_home: float, avg_away: float, iters: int = AD_MAX_ITERS, tol: float = AD_TOL):
+    """
+    solve_team_strengths مع كاش: نفس البيانات (digest) ونفس المتوسطات → لا ملاءمة إطلاقاً؛
+    وإلا بدء دافئ من أقرب ملاءمة سابقة لنفس الموسم (يوم/جولة إضافية = تكرارات قليلة).
+    """
+    if not FIT_CACHE_ENABLED:
+        return solve_team_strengths(arr, avg_home, avg_away, PRIOR_GAMES, iters, tol)[:2]
+    hp = _fit_hp_key(iters, tol)
+    exact, nearest = _fit_cache_lookup(comp_id, season, as_of, hp)
+    if exact is not None and exact["digest"] == arr.digest() and exact["avg"] == [avg_home, avg_away]:
+        return arr.vector(dict(zip(exact["team_ids"], exact["A"]))), arr.vector(dict(zip(exact["team_ids"], exact["D"])))
+    init = None
+    if nearest is not None:
+        init = (arr.vector(dict(zip(nearest["team_ids"], nearest["A"]))), arr.vector(dict(zip(nearest["team_ids"], nearest["D"]))))
+    A, D, n_it = solve_team_strengths(arr, avg_home, avg_away, PRIOR_GAMES, iters, tol, init=init)
+    _fit_cache_store(comp_id, season, as_of, hp, {
+        "digest": arr.digest(), "avg": [avg_home, avg_away], "iters": n_it, "warm": init is not None,
+        "team_ids": arr.team_ids.tolist(), "A": A.tolist(), "D": D.tolist(),
+    })
+    return A, D
+
+def build_iterative_team_factors(comp_id: int, date_from: str, date_to: str, league_avgs: dict, iters: int = AD_MAX_ITERS, tol: float = AD_TOL):
+    """ قوى A/D لكل فريق؛ iters = أقصى عدد تكرارات (يتوقف مبكراً عند tol). الملاءمة مخزنة حسب (مسابقة، موسم، as-of). """
+    matches = get_competition_arrays(comp_id, date_from, date_to)
+    if not len(matches):
+        return {}, {}, matches
+
+    A, D = fit_team_strengths_cached(
+        comp_id, date_from, date_to, matches, league_avgs["avg_home_goals"], league_avgs["avg_away_goals"], iters, tol
+    )
 
     # (1) انكماش مبكر لقوى الفرق A/D حسب حجم العينة
     M0 = 10.0  # عدد مباريات الهدف قبل الإطلاق الكامل
-    for i in team_ids:
-        w = min(1.0, match_counts.get(i, 0) / M0)
-        A[i] = 1.0 + w * (A[i] - 1.0)
-        D[i] = 1.0 + w * (D[i] - 1.0)
+    match_counts = np.bincount(matches.home, minlength=matches.n_teams) + np.bincount(matches.away, minlength=matches.n_teams)
+    sw = np.minimum(1.0, match_counts / M0)
+    A = 1.0 + sw * (A - 1.0)
+    D = 1.0 + sw * (D - 1.0)
 
-    return A, D, matches
+    return matches.to_dict(A), matches.to_dict(D), matches
 
 # ===========================
 # Dixon-Coles (MLE للـ rho)
 # ===========================
 def draw_prob_independent(lh, la, max_goals=MAX_GOALS_GRID):
-    pX = [poisson_pmf(i, lh) for i in range(max_goals + 1)]
-    pY = [poisson_pmf(j, la) for j in range(max_goals + 1)]
-    return sum(pX[k] * pY[k] for k in range(max_goals + 1))
-
-def _dc_tau(i, j, lh, la, rho):
-    if i == 0 and j == 0:
-        return max(1e-6, 1.0 - rho * lh * la)
-    if i == 0 and j == 1:
-        return max(1e-6, 1.0 + rho * lh)
-    if i == 1 and j == 0:
-        return max(1e-6, 1.0 + rho * la)
-    if i == 1 and j == 1:
-        return max(1e-6, 1.0 - rho)
-    return 1.0
-
-def _log_p_pois(k, lam):
-    if lam <= 0:
-        return 0.0 if k == 0 else -1e9
-    return k * math.log(lam) - lam - math.lgamma(k + 1)
+    return scoreline_engine.draw_prob_independent(lh, la, max_goals)
 
-def fit_dc_rho_mle(matches, A, D, league_avgs, rho_min=-DC_RHO_MAX, rho_max=DC_RHO_MAX, step=0.01):
-    """ معايرة rho بطريقة MLE عبر grid search بسيط. """
+def _dc_low_score_terms(hg, ag, lh, la):
+    """
+    الحدود الوحيدة التي تعتمد على rho (نتائج 0-0/0-1/1-0/1-1) — تُستخرج مرة واحدة:
+    λh·λa لـ 0-0، λh لـ 0-1، λa لـ 1-0، وعدد 1-1.
+    """
+    m00 = (hg == 0) & (ag == 0)
+    m01 = (hg == 0) & (ag == 1)
+    m10 = (hg == 1) & (ag == 0)
+    n11 = int(np.count_nonzero((hg == 1) & (ag == 1)))
+    return lh[m00] * la[m00], lh[m01], la[m10], n11
+
+def _brent_minimize(f, lo, hi, tol=1e-6, max_iter=100):
+    """ Brent المحدود (مقطع ذهبي + قطع مكافئ) لدالة أحادية المتغير على [lo, hi]. """
+    golden = 0.3819660112501051
+    x = w = v = lo + golden * (hi - lo)
+    fx = fw = fv = f(x)
+    d = e = 0.0
+    for _ in range(max_iter):
+        mid = 0.5 * (lo + hi)
+        tol1 = tol * abs(x) + 1e-10
+        tol2 = 2.0 * tol1
+        if abs(x - mid) <= tol2 - 0.5 * (hi - lo):
+            break
+        use_golden = True
+        if abs(e) > tol1:
+            # قطع مكافئ عبر x, w, v
+            r = (x - w) * (fx - fv)
+            q = (x - v) * (fx - fw)
+            p = (x - v) * q - (x - w) * r
+            q = 2.0 * (q - r)
+            if q > 0.0:
+                p = -p
+            q = abs(q)
+            if abs(p) < abs(0.5 * q * e) and q * (lo - x) < p < q * (hi - x):
+                e, d = d, p / q
+                u = x + d
+                if (u - lo) < tol2 or (hi - u) < tol2:
+                    d = tol1 if x < mid else -tol1
+                use_golden = False
+        if use_golden:
+            e = (hi - x) if x < mid else (lo - x)
+            d = golden * e
+        u = x + (d if abs(d) >= tol1 else (tol1 if d > 0 else -tol1))
+        fu = f(u)
+        if fu <= fx:
+            if u < x:
+                hi = x
+            else:
+                lo = x
+            v, w, x = w, x, u
+            fv, fw, fx = fw, fx, fu
+        else:
+            if u < x:
+                lo = u
+            else:
+                hi = u
+            if fu <= fw or w == x:
+                v, w = w, u
+                fv, fw = fw, fu
+            elif fu <= fv or v == x or v == w:
+                v, fv = u, fu
+    return x, fx
+
+def fit_dc_rho_mle(matches, A, D, league_avgs, rho_min=-DC_RHO_MAX, rho_max=DC_RHO_MAX, tol=1e-6):
+    """
+    معايرة rho بطريقة MLE دقيقة: حدود بواسون لا تعتمد على rho فتُهمل،
+    وما يبقى (log τ لنتائج 0/1 فقط) مقعّر → بحث Brent محدود على [rho_min, rho_max].
+    """
     if not matches or not A or not D:
         return 0.0
     avg_home = league_avgs["avg_home_goals"]
     avg_away = league_avgs["avg_away_goals"]
 
-    def loglik(rho):
-        ll = 0.0
-        for m in matches:
-            h = m.get("homeTeam", {}).get("id")
-            a = m.get("awayTeam", {}).get("id")
-            if not h or not a:
-                continue
-            hg, ag = parse_score(m)
-            if hg is None or ag is None:
-                continue
-            lh = max(1e-6, avg_home * A.get(h, 1.0) * D.get(a, 1.0))
-            la = max(1e-6, avg_away * A.get(a, 1.0) * D.get(h, 1.0))
-            tau = _dc_tau(hg, ag, lh, la, rho)
-            ll += _log_p_pois(hg, lh) + _log_p_pois(ag, la) + math.log(tau)
-        return ll
-
-    best_rho, best_ll = 0.0, -1e18
-    r = rho_min
-    while r <= rho_max + 1e-12:
-        ll = loglik(r)
-        if ll > best_ll:
-            best_ll, best_rho = ll, r
-        r += step
-    return clamp(best_rho, rho_min, rho_max)
+    arr = as_match_arrays(matches)
+    if not len(arr):
+        return 0.0
+    Av, Dv = arr.vector(A), arr.vector(D)
+    lh = np.maximum(1e-6, avg_home * Av[arr.home] * Dv[arr.away])
+    la = np.maximum(1e-6, avg_away * Av[arr.away] * Dv[arr.home])
+    x00, lh01, la10, n11 = _dc_low_score_terms(arr.hg, arr.ag, lh, la)
+    if not (len(x00) or len(lh01) or len(la10) or n11):
+        return 0.0
+
+    def neg_loglik(rho):
+        ll = float(np.sum(np.log(np.maximum(1e-6, 1.0 - rho * x00))))
+        ll += float(np.sum(np.log(np.maximum(1e-6, 1.0 + rho * lh01))))
+        ll += float(np.sum(np.log(np.maximum(1e-6, 1.0 + rho * la10))))
+        ll += n11 * math.log(max(1e-6, 1.0 - rho))
+        return -ll
+
+    rho, _ = _brent_minimize(neg_loglik, rho_min, rho_max, tol=tol)
+    # Brent لا يقيّم الطرفين: الحل على الحد يُلتقط بالمقارنة المباشرة
+    rho = min((rho, rho_min, rho_max), key=neg_loglik)
+    return clamp(rho, rho_min, rho_max)
+
+# ===========================
+# Dixon-Coles مشترك (MLE كامل بتدرجات تحليلية)
+# ===========================
+def _lbfgs_minimize(fun_grad, x0, m=10, max_iter=200, gtol=1e-6):
+    """ L-BFGS بسيط على NumPy: تكرار الحلقتين + بحث خطي بالتراجع (Armijo). يعيد (x, f, عدد التكرارات). """
+    x = np.array(x0, dtype=float)
+    f, g = fun_grad(x)
+    s_hist, y_hist = [], []
+    it = 0
+    for it in range(1, max_iter + 1):
+        if np.max(np.abs(g)) < gtol:
+            break
+        # اتجاه البحث: تقريب H⁻¹·g
+        q = g.copy()
+        alphas = []
+        for s_k, y_k in reversed(list(zip(s_hist, y_hist))):
+            a_k = s_k.dot(q) / y_k.dot(s_k)
+            alphas.append(a_k)
+            q -= a_k * y_k
+        if s_hist:
+            q *= s_hist[-1].dot(y_hist[-1]) / y_hist[-1].dot(y_hist[-1])
+        for (s_k, y_k), a_k in zip(zip(s_hist, y_hist), reversed(alphas)):
+            q += s_k * (a_k - y_k.dot(q) / y_k.dot(s_k))
+        d = -q
+        slope = g.dot(d)
+        if slope >= 0:
+            d, slope = -g, -g.dot(g)
+            s_hist, y_hist = [], []
+        step = 1.0
+        while True:
+            x_new = x + step * d
+            f_new, g_new = fun_grad(x_new)
+            if f_new <= f + 1e-4 * step * slope or step < 1e-10:
+                break
+            step *= 0.5
+        s_k, y_k = x_new - x, g_new - g
+        if s_k.dot(y_k) > 1e-12:
+            s_hist.append(s_k)
+            y_hist.append(y_k)
+            if len(s_hist) > m:
+                s_hist.pop(0)
+                y_hist.pop(0)
+        converged = abs(f - f_new) <= 1e-12 * max(1.0, abs(f))
+        x, f, g = x_new, f_new, g_new
+        if converged:
+            break
+    return x, f, it
+
+def fit_dixon_coles_joint(arr: MatchArrays, ridge: float = DC_MLE_RIDGE, rho_max: float = DC_RHO_MAX, max_iter: int = 200):
+    """
+    MLE مشترك لـ Dixon-Coles بأوزان EWMA (arr.w):
+        log λh = μ + home + att[h] + def[a] ،  log λa = μ + att[a] + def[h] ،  rho = rho_max · tanh(r)
+    انكماش L2 على att/def (ridge) ثم توسيط att/def إلى مجموع صفري (يُنقل الفرق إلى μ).
+    يعيد dict: A=exp(att)، D=exp(def)، rho، avg_home=exp(μ+home)، avg_away=exp(μ)، iters.
+    """
+    n = arr.n_teams
+    h, a, w = arr.home, arr.away, arr.w
+    hg, ag = arr.hg.astype(float), arr.ag.astype(float)
+    m00 = (arr.hg == 0) & (arr.ag == 0)
+    m01 = (arr.hg == 0) & (arr.ag == 1)
+    m10 = (arr.hg == 1) & (arr.ag == 0)
+    m11 = (arr.hg == 1) & (arr.ag == 1)
+    # θ = [μ, home, att(n), def(n), r]
+    i_att, i_def, i_r = 2, 2 + n, 2 + 2 * n
+
+    def fun_grad(theta):
+        mu, home = theta[0], theta[1]
+        att, dfn, r = theta[i_att:i_def], theta[i_def:i_r], theta[i_r]
+        rho = rho_max * math.tanh(r)
+        log_lh = mu + home + att[h] + dfn[a]
+        log_la = mu + att[a] + dfn[h]
+        lh, la = np.exp(log_lh), np.exp(log_la)
+
+        # τ ومشتقاته (log τ بالنسبة لـ log λh، log λa، rho) على نتائج 0/1 فقط
+        tau = np.ones(len(hg))
+        tau[m00] = 1.0 - rho * lh[m00] * la[m00]
+        tau[m01] = 1.0 + rho * lh[m01]
+        tau[m10] = 1.0 + rho * la[m10]
+        tau[m11] = 1.0 - rho
+        ok = tau > 1e-6
+        tau = np.where(ok, tau, 1e-6)
+        dlh = np.zeros(len(hg))
+        dla = np.zeros(len(hg))
+        drho = np.zeros(len(hg))
+        dlh[m00] = -rho * lh[m00] * la[m00] / tau[m00]
+        dla[m00] = dlh[m00]
+        drho[m00] = -lh[m00] * la[m00] / tau[m00]
+        dlh[m01] = rho * lh[m01] / tau[m01]
+        drho[m01] = lh[m01] / tau[m01]
+        dla[m10] = rho * la[m10] / tau[m10]
+        drho[m10] = la[m10] / tau[m10]
+        drho[m11] = -1.0 / tau[m11]
+        dlh, dla, drho = dlh * ok, dla * ok, drho * ok
+
+        ll = np.sum(w * (hg * log_lh - lh + ag * log_la - la + np.log(tau)))
+        pen = 0.5 * ridge * (att.dot(att) + dfn.dot(dfn))
+        # مشتق −ll بالنسبة لـ log λ لكل مباراة
+        gh = -w * (hg - lh + dlh)
+        ga = -w * (ag - la + dla)
+        grad = np.empty_like(theta)
+        grad[0] = gh.sum() + ga.sum()
+        grad[1] = gh.sum()
+        grad[i_att:i_def] = np.bincount(h, weights=gh, minlength=n) + np.bincount(a, weights=ga, minlength=n) + ridge * att
+        grad[i_def:i_r] = np.bincount(a, weights=gh, minlength=n) + np.bincount(h, weights=ga, minlength=n) + ridge * dfn
+        grad[i_r] = -np.sum(w * drho) * rho_max * (1.0 - math.tanh(r) ** 2)
+        return -ll + pen, grad
+
+    theta0 = np.zeros(i_r + 1)
+    mean_h = max(1e-3, float(np.average(hg, weights=w))) if len(hg) else 1.4
+    mean_a = max(1e-3, float(np.average(ag, weights=w))) if len(ag) else 1.1
+    theta0[0] = math.log(mean_a)
+    theta0[1] = math.log(mean_h / mean_a)
+    theta, _, iters = _lbfgs_minimize(fun_grad, theta0, max_iter=max_iter)
+
+    mu, home = theta[0], theta[1]
+    att, dfn = theta[i_att:i_def], theta[i_def:i_r]
+    ca, cd = att.mean(), dfn.mean()
+    att, dfn, mu = att - ca, dfn - cd, mu + ca + cd
+    return {
+        "A": arr.to_dict(np.exp(att)),
+        "D": arr.to_dict(np.exp(dfn)),
+        "rho": rho_max * math.tanh(theta[i_r]),
+        "avg_home": math.exp(mu + home),
+        "avg_away": math.exp(mu),
+        "iters": iters,
+    }
 
 def poisson_matrix_dc(lh, la, rho=0.0, max_goals=MAX_GOALS_GRID):
-    pX = [poisson_pmf(i, lh) for i in range(max_goals + 1)]
-    pY = [poisson_pmf(j, la) for j in range(max_goals + 1)]
-    M = [[pX[i] * pY[j] for j in range(max_goals + 1)] for i in range(max_goals + 1)]
-    k00 = max(0.001, 1.0 - rho * lh * la)
-    k01 = max(0.001, 1.0 + rho * lh)
-    k10 = max(0.001, 1.0 + rho * la)
-    k11 = max(0.001, 1.0 - rho)
-    if max_goals >= 0:
-        M[0][0] *= k00
-    if max_goals >= 1:
-        M[0][1] *= k01
-        M[1][0] *= k10
-        M[1][1] *= k11
-    s = sum(sum(row) for row in M)
-    if s > 0:
-        for i in range(max_goals + 1):
-            for j in range(max_goals + 1):
-                M[i][j] /= s
-    return M
+    """ مصفوفة النتائج كـ ndarray (G+1)×(G+1) — المحرك المتجه في scoreline_engine. """
+    return scoreline_engine.score_matrix(lh, la, rho, max_goals)
 
 def matrix_to_outcomes(M):
-    n = len(M) - 1
-    p_home = p_draw = p_away = 0.0
-    top = []
-    for i in range(n + 1):
-        for j in range(n + 1):
-            pij = M[i][j]
-            if i > j:
-                p_home += pij
-            elif i == j:
-                p_draw += pij
-            else:
-                p_away += pij
-            top.append(((i, j), pij))
-    top.sort(key=lambda x: x[1], reverse=True)
-    top5 = [{"score": f"{s[0]}-{s[1]}", "prob": round(100 * p, 2)} for (s, p) in top[:5]]
-    return p_home, p_draw, p_away, top5
+    return scoreline_engine.matrix_to_outcomes(M)
 
 def matrix_markets(M):
-    n = len(M) - 1
-    p_btts = 0.0
-    p_clean_home = 0.0
-    p_clean_away = 0.0
-    for i in range(n + 1):
-        for j in range(n + 1):
-            pij = M[i][j]
-            if i > 0 and j > 0:
-                p_btts += pij
-            if j == 0:
-                p_clean_home += pij
-            if i == 0:
-                p_clean_away += pij
-    p_total = {t: 0.0 for t in range(0, 2 * n + 1)}
-    for i in range(n + 1):
-        for j in range(n + 1):
-            p_total[i + j] += M[i][j]
-
-    def over_under(th):
-        floor = int(math.floor(th))
-        p_under = sum(p_total.get(k, 0.0) for k in range(0, floor + 1))
-        p_over = 1.0 - p_under
-        return p_over, p_under
-
-    ou_lines = {}
-    for line in [1.5, 2.5, 3.5]:
-        o, u = over_under(line)
-        ou_lines[str(line)] = {"over": round(100 * o, 1), "under": round(100 * u, 1)}
-    return {
-        "BTTS_yes": f"{round(100 * p_btts, 1)}%",
-        "clean_sheet_home": f"{round(100 * p_clean_home, 1)}%",
-        "clean_sheet_away": f"{round(100 * p_clean_away, 1)}%",
-        "over_under": ou_lines,
-    }
+    return scoreline_engine.matrix_markets(M)
 
 # ===========================
 # تقويم مجموع الأهداف λ
@@ -978,35 +2228,228 @@ def shrink_to_base_total(lh, la, base_h, base_a, gamma=LAM_TOTAL_SHRINK):
 # ===========================
 # ELO
 # ===========================
-@lru_cache(maxsize=32)
+ELO_K_BASE = 20.0
+ELO_HOME_ADV = 50.0
+
+def _elo_update(Rh, Ra, hg, ag, K_base=ELO_K_BASE, H_adv=ELO_HOME_ADV):
+    Eh = 1.0 / (1.0 + 10 ** (-(((Rh + H_adv) - Ra) / 400.0)))
+    Sh = 1.0 if hg > ag else (0.5 if hg == ag else 0.0)
+    goal_diff = abs(hg - ag)
+    K = K_base * (1.0 + math.log2(goal_diff + 1.0))
+    Rh_new = Rh + K * (Sh - Eh)
+
+    Ea = 1.0 - Eh
+    Sa = 1.0 - Sh
+    Ra_new = Ra + K * (Sa - Ea)
+    return Rh_new, Ra_new
+
+class EloState:
+    """
+    حالة ELO دائمة لمسابقة/موسم: تاريخ تقييم كل فريق بعد كل مباراة [(ts, match_id, day, rating)]
+    + النتائج المطبّقة. المباريات الجديدة تُطبّق تزايدياً؛ نتيجة متأخرة/مصححة ترجع الحالة إلى ما قبلها فقط.
+    التاريخ نفسه هو اللقطات: التقييم في أي يوم سابق = bisect على تاريخ الفريق.
+    """
+    def __init__(self, comp_id: int, season: str):
+        self.comp_id = comp_id
+        self.season = season
+        self.applied = {}  # match_id -> (hg, ag)
+        self.history = {}  # team_id -> [(ts, match_id, day, rating)] زمنياً
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    def _rating(self, team_id: int):
+        hist = self.history.get(team_id)
+        return hist[-1][3] if hist else 1500.0
+
+    def _rating_before(self, team_id: int, day: int):
+        """ التقييم الداخل لمباراة في يوم day. """
+        return self._rating(team_id)
+
+    def ratings_as_of(self, day: int = None):
+        """ تقييمات كل الفرق بعد آخر مباراة يومها <= day (None = الأحدث). """
+        out = {}
+        for tid, hist in self.history.items():
+            i = len(hist) if day is None else bisect.bisect_right(hist, day, key=lambda e: e[2])
+            if i:
+                out[tid] = hist[i - 1][3]
+        return out
+
+    def update(self, arr: MatchArrays):
+        """ يطبّق مباريات arr غير المطبّقة (أو المتغيرة) بالترتيب الزمني. يعيد عدد المباريات المطبّقة. """
+        tids = arr.team_ids.tolist()
+        rows = list(zip(arr.ts.tolist(), arr.ids.tolist(), arr.day.tolist(), arr.home.tolist(), arr.away.tolist(), arr.hg.tolist(), arr.ag.tolist()))
+        start = next((i for i, r in enumerate(rows) if self.applied.get(r[1]) != (r[5], r[6])), None)
+        if start is None:
+            return 0
+        # ارجع إلى ما قبل أول مباراة جديدة/متغيرة (عادة لا شيء: المباريات الجديدة بعد الـ watermark)
+        cut = rows[start][:2]
+        for hist in self.history.values():
+            while hist and hist[-1][:2] >= cut:
+                self.applied.pop(hist.pop()[1], None)
+        for ts, mid, day, hi, ai, hg, ag in rows[start:]:
+            h, a = tids[hi], tids[ai]
+            Rh_new, Ra_new = _elo_update(self._rating_before(h, day), self._rating_before(a, day), hg, ag)
+            self.history.setdefault(h, []).append((ts, mid, day, Rh_new))
+            self.history.setdefault(a, []).append((ts, mid, day, Ra_new))
+            self.applied[mid] = (hg, ag)
+        return len(rows) - start
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        conn = _get_db()
+        if conn is None:
+            return
+        with _db_lock:
+            row = conn.execute("SELECT body FROM elo_state WHERE comp_id = ? AND season = ?", (self.comp_id, self.season)).fetchone()
+        if not row:
+            return
+        body = json.loads(row[0])
+        self.applied = {int(k): tuple(v) for k, v in body.get("applied", {}).items()}
+        self.history = {int(k): [tuple(e) for e in v] for k, v in body.get("history", {}).items()}
+
+    def save(self):
+        conn = _get_db()
+        if conn is None:
+            return
+        body = {"applied": self.applied, "history": self.history}
+        try:
+            with _db_lock:
+                conn.execute(
+                    "INSERT OR REPLACE INTO elo_state (comp_id, season, body, updated_at) VALUES (?, ?, ?, ?)",
+                    (self.comp_id, self.season, json.dumps(body), time.time()),
+                )
+                conn.commit()
+        except Exception as e:
+            log(f"[{now_str()}] Elo state write error: {e}")
+
+_ELO_STATES = {}
+_elo_states_lock = threading.Lock()
+
+def get_elo_state(comp_id: int, season: str):
+    with _elo_states_lock:
+        st = _ELO_STATES.get((comp_id, season))
+        if st is None:
+            st = _ELO_STATES[(comp_id, season)] = EloState(comp_id, season)
+    return st
+
+def invalidate_elo_state(comp_id: int = None):
+    """ يمسح حالة ELO (لمسابقة واحدة أو للجميع) من الذاكرة والقرص. """
+    with _elo_states_lock:
+        for k in [k for k in _ELO_STATES if comp_id is None or k[0] == comp_id]:
+            _ELO_STATES.pop(k, None)
+    _reset_global_elo()
+    conn = _get_db()
+    if conn is None:
+        return
+    with _db_lock:
+        if comp_id is None:
+            conn.execute("DELETE FROM elo_state")
+        else:
+            # الحالة العالمية (comp_id = 0) مبنية من كل المسابقات → تُمسح معها
+            conn.execute("DELETE FROM elo_state WHERE comp_id IN (?, 0)", (comp_id,))
+        conn.commit()
+
+class GlobalEloState(EloState):
+    """
+    ELO واحد لكل المسابقات المخزنة (دوري + كؤوس) بترتيب زمني عبر المواسم:
+    بعد فجوة أطول من ELO_SEASON_GAP_DAYS يرتد تقييم الفريق نحو 1500 بنسبة ELO_REGRESS.
+    """
+    def __init__(self):
+        super().__init__(0, "global")
+        self.seen = None  # نسخ المخازن التي بُنيت منها الحالة
+
+    def _rating_before(self, team_id: int, day: int):
+        hist = self.history.get(team_id)
+        if not hist:
+            return 1500.0
+        r = hist[-1][3]
+        if day and hist[-1][2] and day - hist[-1][2] > ELO_SEASON_GAP_DAYS:
+            r = 1500.0 + (r - 1500.0) * (1.0 - ELO_REGRESS)
+        return r
+
+    def rating_as_of(self, team_id: int, as_of):
+        """ تقييم فريق قبل/في يوم as_of (ISO أو ترتيب يوم)، مع ارتداد الموسم إن سبقته فجوة. """
+        day = _iso_day(as_of) if isinstance(as_of, str) else as_of
+        hist = self.history.get(team_id)
+        if not hist:
+            return 1500.0
+        i = bisect.bisect_right(hist, day, key=lambda e: e[2])
+        if not i:
+            return 1500.0
+        r = hist[i - 1][3]
+        if day - hist[i - 1][2] > ELO_SEASON_GAP_DAYS:
+            r = 1500.0 + (r - 1500.0) * (1.0 - ELO_REGRESS)
+        return r
+
+def _all_stored_matches():
+    """ كل مباريات المخزن (القرص + الذاكرة) لكل المسابقات كسجلات MatchRec، مرتبة زمنياً. """
+    recs = {}
+    conn = _get_db()
+    if conn is not None:
+        with _db_lock:
+            rows = conn.execute("SELECT comp_id, body FROM match_store").fetchall()
+        for comp_id, body in rows:
+            r = json.loads(body)
+            m = project_match(r, comp_id) if isinstance(r, dict) else MatchRec(*r)
+            recs[m.id] = m
+    with _match_stores_lock:
+        stores = list(_MATCH_STORES.values())
+    for store in stores:
+        with store.lock:
+            recs.update(store.matches)
+    out = [m for m in recs.values() if m.id is not None]
+    out.sort(key=lambda x: (x.ts, x.id))
+    return out
+
+_GLOBAL_ELO = None
+_global_elo_lock = threading.Lock()
+
+def _reset_global_elo():
+    """ يُسقط حالة ELO العالمية من الذاكرة (تُعاد من القرص/المخازن عند أول طلب). """
+    global _GLOBAL_ELO
+    with _global_elo_lock:
+        _GLOBAL_ELO = None
+
+def global_elo():
+    """ حالة ELO العالمية محدّثة بما في المخازن (تمريرة متدفقة واحدة للجديد فقط). """
+    global _GLOBAL_ELO
+    with _global_elo_lock:
+        if _GLOBAL_ELO is None:
+            _GLOBAL_ELO = GlobalEloState()
+        st = _GLOBAL_ELO
+    with _match_stores_lock:
+        seen = tuple(sorted((cid, store.version) for cid, store in _MATCH_STORES.items()))
+    with st.lock:
+        st.load()
+        if st.seen != seen:
+            if st.update(MatchArrays(_all_stored_matches())):
+                st.save()
+            st.seen = seen
+    return st
+
+def ratings_as_of(team_id: int, as_of):
+    """ تقييم ELO العالمي لفريق في تاريخ ما (ISO أو ترتيب يوم). """
+    return global_elo().rating_as_of(team_id, as_of)
+
 def build_elo_table(comp_id: int, date_from: str, date_to: str):
-    matches = list(get_competition_matches(comp_id, date_from, date_to) or [])
-    matches.sort(key=lambda x: x.get("utcDate", ""))
-    ratings = {}
-    K_base = 20.0
-    H_adv = 50.0
-    for m in matches:
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
-        if not h or not a:
-            continue
-        hg, ag = parse_score(m)
-        if hg is None or ag is None:
-            continue
-        Rh = ratings.get(h, 1500.0)
-        Ra = ratings.get(a, 1500.0)
-        Eh = 1.0 / (1.0 + 10 ** (-(((Rh + H_adv) - Ra) / 400.0)))
-        Sh = 1.0 if hg > ag else (0.5 if hg == ag else 0.0)
-        goal_diff = abs(hg - ag)
-        K = K_base * (1.0 + math.log2(goal_diff + 1.0))
-        Rh_new = Rh + K * (Sh - Eh)
-
-        Ea = 1.0 - Eh
-        Sa = 1.0 - Sh
-        Ra_new = Ra + K * (Sa - Ea)
-        ratings[h] = Rh_new
-        ratings[a] = Ra_new
-    return ratings
+    """ تقييمات ELO للموسم (من date_from) حتى date_to — تحديث تزايدي للحالة الدائمة ثم قراءة اللقطة. """
+    df, dt = normalize_date_range(date_from, date_to)
+    arr = get_competition_arrays(comp_id, df, dt)  # مرتبة زمنياً
+    st = get_elo_state(comp_id, df)
+    with st.lock:
+        st.load()
+        if st.update(arr):
+            st.save()
+        return st.ratings_as_of(_iso_day(dt))
+
+def elo_ratings_as_of(comp_id: int, season_start: str, as_of: str):
+    """ تقييمات ELO المخزنة كما كانت في يوم سابق (بدون شبكة أو إعادة حساب). """
+    st = get_elo_state(comp_id, season_start)
+    with st.lock:
+        st.load()
+        return st.ratings_as_of(_iso_day(as_of))
 
 def elo_scales(Rh, Ra, elo_home_adv=50.0, scale=ELO_SCALE):
     Eh = 1.0 / (1.0 + 10 ** (-(((Rh + elo_home_adv) - Ra) / 400.0)))
@@ -1074,6 +2517,51 @@ def _kelly_core(p, odds_dec, scale=KELLY_SCALE):
     except Exception:
         return None
 
+def _kelly_settled(outcomes, odds_dec, scale=KELLY_SCALE):
+    """
+    كيللي لرهان بتسوية آسيوية [win, half_win, push, half_loss, loss]:
+    يعظّم Σ p·log(1 + f·r) بالتنصيف على المشتقة (f ≤ KELLY_MAX_FRAC).
+    """
+    try:
+        if outcomes is None or odds_dec is None or odds_dec <= 1.0:
+            return None
+        b = odds_dec - 1.0
+        p = np.asarray(outcomes, dtype=float)
+        r = np.array([b, 0.5 * b, 0.0, -0.5, -1.0])
+        implied = 1.0 / odds_dec
+        ev = scoreline_engine.settle_ev(p, odds_dec)
+        p_eff = scoreline_engine.effective_prob(p, odds_dec)
+        edge = p_eff - implied
+        if edge < KELLY_MIN_EDGE:
+            return None
+
+        def _grad(f):
+            return float(np.sum(p * r / (1.0 + f * r)))
+
+        lo, hi = 0.0, KELLY_MAX_FRAC
+        if _grad(hi) > 0:
+            k_full = hi
+        else:
+            for _ in range(60):
+                mid = 0.5 * (lo + hi)
+                if _grad(mid) > 0:
+                    lo = mid
+                else:
+                    hi = mid
+            k_full = 0.5 * (lo + hi)
+        return {
+            "prob": round(p_eff, 4),
+            "odds": round(odds_dec, 4),
+            "implied": round(implied, 4),
+            "edge": round(edge, 4),
+            "kelly_full": round(k_full, 4),
+            "kelly_scaled": round(k_full * scale, 4),
+            "EV_per_unit": round(ev, 4),
+            "settle": {k: round(float(v), 4) for k, v in zip(scoreline_engine.SETTLE_OUTCOMES, p)}
+        }
+    except Exception:
+        return None
+
 def _extract_1x2_odds(odds):
     """ يستخرج أودز 1X2 من هيكل odds """
     if not isinstance(odds, dict):
@@ -1155,8 +2643,13 @@ def _odds_lookup(odds, *keys, default=None):
             return norm[kk]
     return default
 
-def kelly_suggestions_markets(mkts, odds):
-    """ يقترح نسب كيللي لأسواق إضافية لو توفرت أودزها """
+def kelly_suggestions_markets(mkts, odds, market_engine=None):
+    """
+    يقترح نسب كيللي لأسواق إضافية لو توفرت أودزها.
+    مع market_engine (scoreline_engine.MarketEngine) تُسعَّر أي خطوط إضافية في odds
+    (مجاميع بأي خط، هانديكاب آسيوي، مجاميع الفريق، فرصة مزدوجة، DNB، النتيجة الصحيحة،
+    تركيبات نفس المباراة).
+    """
     suggestions = {}
     if not isinstance(odds, dict):
         return suggestions
@@ -1224,6 +2717,9 @@ def kelly_suggestions_markets(mkts, odds):
         if ou_sugg:
             suggestions["over_under"] = ou_sugg
 
+    if market_engine is not None:
+        suggestions.update(_kelly_engine_markets(market_engine, odds, skip_ou=set((suggestions.get("over_under") or {}).keys())))
+
     def _clean(x):
         if isinstance(x, dict):
             return {k: _clean(v) for k, v in x.items() if v is not None and _clean(v) != {}}
@@ -1231,21 +2727,141 @@ def kelly_suggestions_markets(mkts, odds):
 
     return _clean(suggestions)
 
+def _line_odds_pairs(obj, side_keys):
+    """ {line: {side: odds}} → [(line, side, odds)] مع تجاهل القيم غير الصالحة. """
+    out = []
+    if not isinstance(obj, dict):
+        return out
+    for line, sub in obj.items():
+        if not isinstance(sub, dict):
+            continue
+        for side, aliases in side_keys.items():
+            o = _parse_odds_value(_odds_lookup(sub, *aliases))
+            if o:
+                out.append((str(line).strip(), side, o))
+    return out
+
+def _kelly_engine_markets(eng, odds, skip_ou=()):
+    """ كيللي لكل الخطوط المتاحة في odds عبر MarketEngine (بدون إعادة بناء المصفوفة). """
+    res = {}
+    ou_keys = {"over": ("over", "o"), "under": ("under", "u")}
+
+    # Over/Under بأي خط (بما فيها الربعية) لم تُغطَّ سابقاً
+    ou = {}
+    for line, side, o in _line_odds_pairs(_odds_lookup(odds, "over_under", "ou", "totals", default={}), ou_keys):
+        if line in skip_ou:
+            continue
+        try:
+            k = _kelly_settled(eng.totals(line, side), o)
+        except ValueError:
+            continue
+        if k:
+            ou.setdefault(line, {})[side] = k
+    if ou:
+        res["over_under_lines"] = ou
+
+    # هانديكاب آسيوي: الخط من منظور صاحب الأرض، والضيف يأخذ عكسه
+    ah = {}
+    ah_obj = _odds_lookup(odds, "asian_handicap", "ah", "handicap", "spreads", default={})
+    for line, side, o in _line_odds_pairs(ah_obj, {"home": ("home", "h", "1"), "away": ("away", "a", "2")}):
+        try:
+            L = scoreline_engine.parse_line(line)
+            k = _kelly_settled(eng.asian_handicap(L if side == "home" else -L, side), o)
+        except ValueError:
+            continue
+        if k:
+            ah.setdefault(line, {})[side] = k
+    if ah:
+        res["asian_handicap"] = ah
+
+    # مجاميع الفريق
+    tt_obj = _odds_lookup(odds, "team_totals", "team_total", default={})
+    if isinstance(tt_obj, dict):
+        tt = {}
+        for team, aliases in (("home", ("home", "h")), ("away", ("away", "a"))):
+            for line, side, o in _line_odds_pairs(_odds_lookup(tt_obj, *aliases, default={}), ou_keys):
+                try:
+                    k = _kelly_settled(eng.totals(line, side, team=team), o)
+                except ValueError:
+                    continue
+                if k:
+                    tt.setdefault(team, {}).setdefault(line, {})[side] = k
+        if tt:
+            res["team_totals"] = tt
+
+    # فرصة مزدوجة
+    dc_obj = _odds_lookup(odds, "double_chance", "dc", default={})
+    if isinstance(dc_obj, dict):
+        p_1x, p_12, p_x2 = eng.double_chance()
+        dc = {}
+        for key, p, aliases in (("1X", p_1x, ("1x", "home_draw")), ("12", p_12, ("12", "home_away")), ("X2", p_x2, ("x2", "draw_away"))):
+            o = _parse_odds_value(_odds_lookup(dc_obj, *aliases))
+            if o:
+                dc[key] = _kelly_core(float(p), o)
+        if dc:
+            res["double_chance"] = dc
+
+    # Draw No Bet = هانديكاب 0
+    dnb_obj = _odds_lookup(odds, "draw_no_bet", "dnb", default={})
+    if isinstance(dnb_obj, dict):
+        dnb = {}
+        for side, aliases in (("home", ("home", "h", "1")), ("away", ("away", "a", "2"))):
+            o = _parse_odds_value(_odds_lookup(dnb_obj, *aliases))
+            if o:
+                dnb[side] = _kelly_settled(eng.draw_no_bet(side), o)
+        if dnb:
+            res["draw_no_bet"] = dnb
+
+    # النتيجة الصحيحة: {"2-1": odds}
+    cs_obj = _odds_lookup(odds, "correct_score", "cs_book", default={})
+    if isinstance(cs_obj, dict):
+        M = eng.correct_score()
+        cs = {}
+        for score, o in cs_obj.items():
+            m = re.match(r"^\s*(\d+)\s*[-:]\s*(\d+)\s*$", str(score))
+            o = _parse_odds_value(o)
+            if not m or not o:
+                continue
+            i, j = int(m.group(1)), int(m.group(2))
+            p = float(M[i, j]) if i <= eng.n and j <= eng.n else 0.0
+            cs[f"{i}-{j}"] = _kelly_core(p, o)
+        if cs:
+            res["correct_score"] = cs
+
+    # تركيبات نفس المباراة: {"home & over_2.5": odds} — احتمال مشترك دقيق من الشبكة
+    combo_obj = _odds_lookup(odds, "combos", "same_game", "bet_builder", default={})
+    if isinstance(combo_obj, dict) and combo_obj:
+        names, prices = [], []
+        for name, o in combo_obj.items():
+            o = _parse_odds_value(o)
+            if not o:
+                continue
+            bad = scoreline_engine.unknown_combo_legs(str(name), eng.n)
+            if bad:
+                log(f"[{now_str()}] Combo skipped ({name}): unknown legs {bad}")
+                continue
+            names.append(str(name))
+            prices.append(o)
+        probs = eng.combos(names) if names else []
+        combos = {}
+        for name, p, o in zip(names, probs, prices):
+            combos[name] = _kelly_core(float(p), o)
+        if combos:
+            res["combos"] = combos
+    return res
+
 # ===========================
 # عوامل إضافية: فورم + H2H
 # ===========================
 def get_recent_form_factor(team_id: int, comp_id: int, date_from: str, date_to: str, take=5):
     matches = get_team_matches_in_comp(team_id, comp_id, date_from, date_to)
-    matches.sort(key=lambda x: x.get("utcDate", ""), reverse=True)
-    recent = matches[:take]
+    recent = matches[-take:][::-1] if take > 0 else []
     if not recent:
         return 1.0, 0, 0
     points = 0.0
     for i, m in enumerate(recent):
         weight = (take - i) / take
-        h_id = m.get("homeTeam", {}).get("id")
-        a_id = m.get("awayTeam", {}).get("id")
-        hg, ag = parse_score(m)
+        h_id, a_id, hg, ag = m.home, m.away, m.hg, m.ag
         if h_id == team_id:
             if hg > ag:
                 points += 3 * weight
@@ -1268,9 +2884,7 @@ def h2h_adjustment(team1_id: int, team2_id: int, comp_id: int, since: str):
     recent = h2h[:take]
     t1wins = t2wins = 0
     for m in recent:
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
-        hg, ag = parse_score(m)
+        h, a, hg, ag = m.home, m.away, m.hg, m.ag
         if hg != ag:
             winner_id = h if hg > ag else a
             if winner_id == team1_id:
@@ -1283,20 +2897,21 @@ def h2h_adjustment(team1_id: int, team2_id: int, comp_id: int, since: str):
     return clamp(f1, 0.95, 1.05), clamp(f2, 0.95, 1.05), take
 
 # فورم محسّن بجودة الخصوم (SoS)
-def get_recent_form_factor_sos(team_id: int, comp_id: int, date_from: str, date_to: str, ratings: dict, take=5, gamma=FORM_SOS_GAMMA):
+def get_recent_form_factor_sos(team_id: int, comp_id: int, date_from: str, date_to: str, ratings: dict, take=5, gamma=FORM_SOS_GAMMA, rating_fn=None):
+    """ rating_fn(team_id, day) اختياري: تقييم الخصم يوم المباراة نفسها (ELO العالمي) بدل تقييمه الحالي. """
     matches = get_team_matches_in_comp(team_id, comp_id, date_from, date_to)
-    matches.sort(key=lambda x: x.get("utcDate", ""), reverse=True)
-    recent = matches[:take]
+    recent = matches[-take:][::-1] if take > 0 else []
     if not recent:
         return 1.0, 0.0, 0
     mean_r = (sum(ratings.values()) / len(ratings)) if ratings else 1500.0
     wp, denom = 0.0, 0.0
     for i, m in enumerate(recent):
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
-        hg, ag = parse_score(m)
+        h, a, hg, ag = m.home, m.away, m.hg, m.ag
         opp = a if h == team_id else h
-        r_opp = ratings.get(opp, 1500.0) if ratings else 1500.0
+        if rating_fn is not None:
+            r_opp = rating_fn(opp, m.day - 1)  # قبل المباراة
+        else:
+            r_opp = ratings.get(opp, 1500.0) if ratings else 1500.0
         w_strength = clamp(1.0 + gamma * ((r_opp - mean_r) / 200.0), 0.85, 1.15)
         rec_w = (take - i) / take
         points = 0.0
@@ -1317,19 +2932,16 @@ def get_recent_form_factor_sos(team_id: int, comp_id: int, date_from: str, date_
 # معدل التهديف الحديث مقابل المتوقع
 def recent_goal_rate_factor(team_id: int, comp_id: int, A: dict, D: dict, league_avgs: dict, date_from: str, date_to: str, take=5):
     matches = get_team_matches_in_comp(team_id, comp_id, date_from, date_to)
-    matches.sort(key=lambda x: x.get("utcDate", ""), reverse=True)
-    recent = matches[:take]
+    recent = matches[-take:][::-1] if take > 0 else []
     if not recent or not A or not D:
         return 1.0
     avg_home = league_avgs["avg_home_goals"]
     avg_away = league_avgs["avg_away_goals"]
     num = den = 0.0
     for i, m in enumerate(recent):
-        h = m.get("homeTeam", {}).get("id")
-        a = m.get("awayTeam", {}).get("id")
+        h, a, hg, ag = m.home, m.away, m.hg, m.ag
         if not h or not a:
             continue
-        hg, ag = parse_score(m)
         w = (take - i) / take
         if team_id == h:
             lam = max(1e-6, avg_home * A.get(h, 1.0) * D.get(a, 1.0))
@@ -1559,6 +3171,7 @@ def get_team_upcoming_matches(team_id: int, comp_id: int = None, days_ahead: int
         })
     return out
 
+@with_request_priority(PRIORITY_ENRICHMENT)
 def enrich_with_free_stats(result: dict, include_players=True, include_recent=True, include_scorers=True, include_upcoming=False, recent_days=180, recent_limit=5, recent_all_comps=False, squad_limit=None, scorers_limit=20):
     """ يُثري مخرجات predict_match بمفتاح extra """
     try:
@@ -1694,30 +3307,15 @@ def squad_based_factors(team_id: int):
     return clamp(gf_mult, 0.95, 1.07), clamp(opp_concede_mult, 0.93, 1.07), {"squad": m, "notes": notes}
 
 def team_home_away_split_factors(team_id: int, is_home: bool, used_matches: list, league_avgs: dict, take: int = HOME_AWAY_SPLIT_TAKE, alpha: float = HOME_AWAY_SPLIT_ALPHA):
-    filtered = []
-    for m in used_matches or []:
-        h = (m.get("homeTeam") or {}).get("id")
-        a = (m.get("awayTeam") or {}).get("id")
-        if not h or not a:
-            continue
-        if is_home and h == team_id:
-            filtered.append(m)
-        elif (not is_home) and a == team_id:
-            filtered.append(m)
-    filtered.sort(key=lambda x: x.get("utcDate",""), reverse=True)
-    filtered = filtered[:take]
-    if not filtered:
+    arr = as_match_arrays(used_matches)
+    # آخر take مباراة من فهرس الفريق (بلا مسح للموسم)
+    sel = arr.recent_positions(team_id, "H" if is_home else "A", take=take)
+    if not len(sel):
         return 1.0, 1.0, {"n": 0}
 
-    gf, ga = 0, 0
-    for m in filtered:
-        ft = (m.get("score") or {}).get("fullTime") or {}
-        hg, ag = ft.get("home") or 0, ft.get("away") or 0
-        if is_home:
-            gf += hg; ga += ag
-        else:
-            gf += ag; ga += hg
-    n = len(filtered)
+    hg, ag = int(arr.hg[sel].sum()), int(arr.ag[sel].sum())
+    gf, ga = (hg, ag) if is_home else (ag, hg)
+    n = len(sel)
     gf_rate = gf / n
     ga_rate = ga / n
     base_gf = league_avgs["avg_home_goals"] if is_home else league_avgs["avg_away_goals"]
@@ -1736,46 +3334,24 @@ def top_scorers_offense_boost(team_id: int, comp_id: int, limit: int):
     boost = clamp(boost, 0.0, TOPSCORER_MAX_BOOST)
     return 1.0 + boost, {"goals": goals, "assists": assists, "boost": round(boost, 4)}
 
-def _points_from_pair(side: str, pair: dict):
-    if not pair or (pair.get("home") is None and pair.get("away") is None):
-        return None
-    h, a = pair.get("home") or 0, pair.get("away") or 0
-    if side == "H":
-        if h > a: return 3
-        if h == a: return 1
-        return 0
-    else:
-        if a > h: return 3
-        if a == h: return 1
-        return 0
+def _points_from_diff(diff):
+    """ نقاط المباراة من فارق الأهداف (متجه). """
+    return np.where(diff > 0, 3, np.where(diff == 0, 1, 0))
 
 def comeback_offense_factor(team_id: int, used_matches: list, take: int = COMEBACK_TAKE):
-    recent = []
-    for m in used_matches or []:
-        h = (m.get("homeTeam") or {}).get("id")
-        a = (m.get("awayTeam") or {}).get("id")
-        if team_id in (h, a):
-            recent.append(m)
-    recent.sort(key=lambda x: x.get("utcDate",""), reverse=True)
-    recent = recent[:take]
-    if not recent:
+    arr = as_match_arrays(used_matches)
+    sel = arr.recent_positions(team_id, take=take)
+    if not len(sel):
         return 1.0, {"n": 0}
-    deltas = []
-    for m in recent:
-        h = m.get("homeTeam") or {}
-        hid = h.get("id")
-        side = "H" if team_id == hid else "A"
-        score = m.get("score") or {}
-        ft = score.get("fullTime") or {}
-        ht = score.get("halfTime") or {}
-        p_ht = _points_from_pair(side, ht)
-        p_ft = _points_from_pair(side, ft)
-        if p_ht is None or p_ft is None:
-            continue
-        deltas.append(p_ft - p_ht)
-    if not deltas:
+    is_h = arr.home[sel] == arr.index[team_id]
+    # (لنا − لهم) في الشوطين؛ الشوط الأول الغائب (-1) يُستبعد
+    ht_ok = (arr.hht[sel] >= 0) | (arr.aht[sel] >= 0)
+    d_ht = np.where(is_h, 1, -1) * (np.maximum(arr.hht[sel], 0) - np.maximum(arr.aht[sel], 0))
+    d_ft = np.where(is_h, 1, -1) * (arr.hg[sel] - arr.ag[sel])
+    deltas = (_points_from_diff(d_ft) - _points_from_diff(d_ht))[ht_ok]
+    if not len(deltas):
         return 1.0, {"n": 0}
-    avg_delta = sum(deltas) / len(deltas)  # -3..+3
+    avg_delta = float(deltas.mean())  # -3..+3
     idx = clamp(avg_delta / 3.0, -1.0, 1.0)
     mult = clamp(1.0 + COMEBACK_MAX * idx, 1.0 - COMEBACK_MAX, 1.0 + COMEBACK_MAX)
     return mult, {"n": len(deltas), "avg_delta_pts": round(avg_delta, 3)}
@@ -1783,18 +3359,10 @@ def comeback_offense_factor(team_id: int, used_matches: list, take: int = COMEBA
 def fatigue_factors(team_id: int, comp_id: int, used_matches: list, season_end_iso: str):
     today = parse_date_safe(season_end_iso) or datetime.now().date()
     past_since = today - timedelta(days=FATIGUE_PAST_DAYS)
-    past_cnt = 0
-    for m in used_matches or []:
-        h = (m.get("homeTeam") or {}).get("id")
-        a = (m.get("awayTeam") or {}).get("id")
-        if team_id not in (h,a):
-            continue
-        d = parse_date_safe((m.get("utcDate","") or "")[:10])
-        if not d:
-            continue
-        if past_since <= d <= today:
-            past_cnt += 1
-    upcoming = get_team_upcoming_matches(team_id, comp_id=comp_id, days_ahead=FATIGUE_NEXT_DAYS, limit=10, all_competitions=False) or []
+    arr = as_match_arrays(used_matches)
+    past_cnt = arr.count_between(team_id, past_since.toordinal(), today.toordinal())
+    with _at_most(PRIORITY_ENRICHMENT):
+        upcoming = get_team_upcoming_matches(team_id, comp_id=comp_id, days_ahead=FATIGUE_NEXT_DAYS, limit=10, all_competitions=False) or []
     next_cnt = len(upcoming)
     load_index = FATIGUE_PAST_WEIGHT * past_cnt + FATIGUE_NEXT_WEIGHT * next_cnt
     over = max(0.0, load_index - FATIGUE_THRESHOLD)
@@ -1848,8 +3416,7 @@ def context_multipliers(extras):
 # شبكة أهداف ديناميكية
 # ===========================
 def dynamic_max_goals(lh, la):
-    m = max(lh, la, 1e-6)
-    return max(8, int(min(15, round(m + 6 * math.sqrt(m)))))
+    return scoreline_engine.dynamic_max_goals(lh, la)
 
 # ===========================
 # معايرة 1×2 بدرجة حرارة
@@ -1860,11 +3427,186 @@ def calibrate_probs_temperature(pH, pX, pA, tau=PROB_TEMP):
     s = sum(ps)
     return (ps[0] / s, ps[1] / s, ps[2] / s)
 
+# ===========================
+# جلب مسبق (Prefetch) لمدخلات التوقع
+# ===========================
+def run_prefetch_graph(tasks: dict, workers: int = PREFETCH_WORKERS):
+    """
+    ينفذ مهام جلب مسبق بحسب الاعتماديات والأولوية.
+    tasks: name -> (priority, deps, fn) — الأولوية الأصغر تُطلق أولاً عند جاهزية اعتمادياتها.
+    لا يُطلق أكثر من workers مهمة معاً كي يبقى ترتيب الأولوية فعّالاً أمام المحدد.
+    فشل مهمة لا يوقف تابعيها (كل مهمة لها مسار احتياطي خاص بها).
+    """
+    pending = dict(tasks)
+    finished_names, failed = [], {}
+    running = {}
+    level = current_request_priority()
+
+    def _in_caller_priority(fn):
+        # خيوط العمال لا ترث أولوية المستدعي
+        def run():
+            with request_priority(level):
+                return fn()
+        return run
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        while pending or running:
+            settled = set(finished_names) | set(failed)
+            ready = sorted(
+                (n for n, (_, deps, _) in pending.items() if all(d in settled or d not in tasks for d in deps)),
+                key=lambda n: (pending[n][0], n),
+            )
+            for n in ready[:max(0, workers - len(running))]:
+                _, _, fn = pending.pop(n)
+                running[ex.submit(_in_caller_priority(fn))] = n
+            if not running:
+                # اعتماديات دائرية — نفّذ الباقي بالترتيب
+                for n in sorted(pending, key=lambda k: pending[k][0]):
+                    running[ex.submit(_in_caller_priority(pending.pop(n)[2]))] = n
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for f in done:
+                n = running.pop(f)
+                try:
+                    f.result()
+                    finished_names.append(n)
+                except Exception as e:
+                    failed[n] = str(e)
+                    log(f"[{now_str()}] Prefetch '{n}' failed: {e}")
+    return {"done": finished_names, "failed": failed}
+
+def _season_data_window(comp_id: int):
+    """ نافذة بيانات الموسم الحالي كما يستخدمها predict_match: (بداية, min(نهاية, اليوم)) """
+    season_start, season_end, _, _, _ = get_competition_current_season_dates(comp_id)
+    today = datetime.now().date()
+    return season_start, min(parse_date_safe(season_end) or today, today).isoformat()
+
+def prediction_prefetch_tasks(t1_id: int, t2_id: int, comp_id: int, scorers_limit: int = SCORERS_LIMIT_DEFAULT):
+    """ رسم اعتماديات موارد API التي يحتاجها predict_match (المسار الحرج: مباريات الموسم أولاً). """
+    since_h2h = (datetime.now().date() - timedelta(days=H2H_LOOKBACK_DAYS)).isoformat()
+
+    def _season_matches():
+        start, end = _season_data_window(comp_id)
+        sync_competition_matches(comp_id, start, end)
+
+    def _upcoming(tid):
+        def run():
+            with _at_most(PRIORITY_ENRICHMENT):
+                return get_team_upcoming_matches(tid, comp_id=comp_id, days_ahead=FATIGUE_NEXT_DAYS, limit=10, all_competitions=False)
+        return run
+
+    return {
+        "competition": (0, (), lambda: get_competition_info(comp_id)),
+        "season_matches": (0, ("competition",), _season_matches),
+        "team1_details": (1, (), lambda: get_team_details(t1_id)),
+        "team2_details": (1, (), lambda: get_team_details(t2_id)),
+        "standings": (1, (), lambda: get_standings_table(comp_id)),
+        "scorers": (1, (), lambda: get_competition_scorers(comp_id, limit=scorers_limit)),
+        "h2h": (2, ("season_matches",), lambda: get_h2h_matches(t1_id, t2_id, comp_id, since_h2h)),
+        "team1_fixtures": (3, (), _upcoming(t1_id)),
+        "team2_fixtures": (3, (), _upcoming(t2_id)),
+    }
+
+def prefetch_prediction_inputs(t1_id: int, t2_id: int, comp_id: int, scorers_limit: int = SCORERS_LIMIT_DEFAULT, workers: int = PREFETCH_WORKERS):
+    """ يسخّن الكاش لكل ما يحتاجه predict_match بطلبات متوازية ضمن ميزانية المحدد. """
+    return run_prefetch_graph(prediction_prefetch_tasks(t1_id, t2_id, comp_id, scorers_limit=scorers_limit), workers=workers)
+
+@with_request_priority(PRIORITY_BACKGROUND)
+def warm_competition_cache(codes, scorers_limit: int = SCORERS_LIMIT_DEFAULT):
+    """
+    تسخين خلفي لكاش مسابقات (فرق، موسم، ترتيب، هدافون) بأولوية BACKGROUND:
+    يتنازل عن الحصة لأي توقع تفاعلي جارٍ ثم يستأنف.
+    """
+    warmed = []
+    for code in codes or []:
+        cid = get_competition_id_by_code(code)
+        if not cid:
+            continue
+        get_competition_teams(cid)
+        start, end = _season_data_window(cid)
+        sync_competition_matches(cid, start, end)
+        get_standings_table(cid)
+        get_competition_scorers(cid, limit=scorers_limit)
+        warmed.append(code)
+    return warmed
+
+# ===========================
+# مخطط ميزانية الطلبات (Dry-run)
+# ===========================
+def _plan_walk_prediction(team1_name: str, team2_name: str, competition_code_override: str = None, scorers_limit: int = SCORERS_LIMIT_DEFAULT):
+    """ يمشي اعتماديات predict_match (أسماء الفرق → المسابقة → المدخلات) داخل وضع التخطيط. """
+    prefer_codes = [competition_code_override.strip().upper()] if competition_code_override else []
+    t1_id = find_team_id_by_name(team1_name, prefer_codes=prefer_codes) or find_team_id_by_name(team1_name)
+    t2_id = find_team_id_by_name(team2_name, prefer_codes=prefer_codes) or find_team_id_by_name(team2_name)
+    comp_id = get_competition_id_by_code(competition_code_override) if competition_code_override else None
+    if not comp_id and t1_id and t2_id:
+        comp_id = choose_best_competition(t1_id, t2_id)
+    # معرفات غير محلولة من الكاش: معرّفات وهمية تكفي لعدّ الطلبات حسب قالب الـ endpoint
+    tasks = prediction_prefetch_tasks(t1_id or -1, t2_id or -2, comp_id or -1, scorers_limit=scorers_limit)
+    pending = dict(tasks)
+    while pending:
+        name = min(pending, key=lambda n: (pending[n][0], n))
+        try:
+            pending.pop(name)[2]()
+        except Exception as e:
+            log(f"[plan] step '{name}' failed: {e}")
+    return {"team1_id": t1_id, "team2_id": t2_id, "competition_id": comp_id}
+
+def plan_predictions(fixtures, scorers_limit: int = SCORERS_LIMIT_DEFAULT):
+    """
+    يخطط دفعة توقعات دون أي اتصال بالشبكة.
+    fixtures: قائمة (team1, team2[, comp_code]) أو dict بمفاتيح team1/team2/comp.
+    يعيد لكل endpoint عدد الطلبات اللازمة/المخزنة (الطلبات المشتركة بين المباريات تُعد مرة واحدة)،
+    والزمن التقديري حسب حالة المحدد الحالية — ليستخدمه المجدول لتعبئة نوافذ الحصة.
+    """
+    rec = _PlanRecorder()
+    prev = _plan_recorder()
+    _plan_ctx.recorder = rec
+    resolved = []
+    try:
+        for fx in fixtures or []:
+            if isinstance(fx, dict):
+                t1, t2, code = fx.get("team1"), fx.get("team2"), fx.get("comp")
+            else:
+                t1, t2, code = (list(fx) + [None])[:3]
+            ids = _plan_walk_prediction(t1, t2, competition_code_override=code, scorers_limit=scorers_limit)
+            resolved.append({"team1": t1, "team2": t2, **ids})
+    finally:
+        _plan_ctx.recorder = prev
+
+    endpoints = {}
+    for r in rec.requests.values():
+        e = endpoints.setdefault(_endpoint_template(r["path"]), {"calls": 0, "cached": 0})
+        e["cached" if r["cached"] else "calls"] += 1
+    total = sum(e["calls"] for e in endpoints.values())
+    wait_sec = API_KEY_POOL.estimate_wait(total)
+    # بدون معرّفات الفرق/معلومات الموسم في الكاش لا يمكن معرفة كل النوافذ → الأعداد حدّ أدنى
+    complete = all(f["team1_id"] and f["team2_id"] and f["competition_id"] for f in resolved) and not any(
+        not r["cached"] and _endpoint_template(r["path"]) == "/competitions/{id}" for r in rec.requests.values()
+    )
+    return {
+        "fixtures": resolved,
+        "complete": complete,
+        "endpoints": dict(sorted(endpoints.items(), key=lambda kv: -kv[1]["calls"])),
+        "total_calls": total,
+        "cached_hits": sum(e["cached"] for e in endpoints.values()),
+        "rate_per_min": round(API_KEY_POOL.capacity, 1) if API_KEY_POOL.enabled else None,
+        "api_keys": len(API_KEY_POOL.states),
+        "estimated_limiter_wait_sec": round(wait_sec, 1),
+        "estimated_seconds": round(wait_sec + total * PLAN_REQUEST_LATENCY_SEC, 1),
+    }
+
+def plan_prediction(team1_name: str, team2_name: str, competition_code_override: str = None, scorers_limit: int = SCORERS_LIMIT_DEFAULT):
+    """ خطة طلبات توقع واحد (انظر plan_predictions). """
+    return plan_predictions([(team1_name, team2_name, competition_code_override)], scorers_limit=scorers_limit)
+
 # ===========================
 # التوقع الرئيسي
 # ===========================
-def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True, competition_code_override: str = None, odds: dict = None, max_goals: int = MAX_GOALS_GRID, extras: dict = None, scorers_limit: int = SCORERS_LIMIT_DEFAULT):
-    """ يتوقع نتيجة مباراة بين فريقين. """
+def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True, competition_code_override: str = None, odds: dict = None, max_goals: int = MAX_GOALS_GRID, extras: dict = None, scorers_limit: int = SCORERS_LIMIT_DEFAULT, engine: str = None):
+    """ يتوقع نتيجة مباراة بين فريقين. engine: ratio | dc_mle (الافتراضي FD_STRENGTH_ENGINE). """
+    engine = (engine or STRENGTH_ENGINE).strip().lower()
+    if engine not in ("ratio", "dc_mle"):
+        raise ValueError(f"محرك غير معروف: {engine} (ratio | dc_mle)")
 
     # 1) IDs للفرق — حاول أولاً عبر المسابقة المفضلة إن وُجدت
     prefer_codes = [competition_code_override.strip().upper()] if competition_code_override else []
@@ -1886,6 +3628,10 @@ def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True,
         comp_id = choose_best_competition(t1_id, t2_id)
         if not comp_id:
             raise RuntimeError("تعذر تحديد مسابقة نشِطة مشتركة بين الفريقين.")
+    # 2b) جلب مسبق متوازٍ لكل المدخلات (الكاش دافئ قبل الحساب)
+    if PREFETCH_ENABLED:
+        prefetch_prediction_inputs(t1_id, t2_id, comp_id, scorers_limit=scorers_limit)
+
     _, _, _, comp_code_used_auto, _ = get_competition_current_season_dates(comp_id)
     if not comp_code_used:
         comp_code_used = comp_code_used_auto
@@ -1899,26 +3645,39 @@ def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True,
     # 4) متوسطات الدوري
     league_avgs = calc_league_averages(comp_id, start_for_data, end_for_data)
 
-    # 5) قوى الفرق A, D, used_matches
-    A, D, used_matches = build_iterative_team_factors(comp_id, start_for_data, end_for_data, league_avgs, iters=8)
-
-    # 6) معايرة rho (MLE)
-    rho = fit_dc_rho_mle(used_matches, A, D, league_avgs)
+    # 5-6) قوى الفرق A, D, used_matches + rho
+    avg_home = league_avgs["avg_home_goals"]
+    avg_away = league_avgs["avg_away_goals"]
+    used_matches = get_competition_arrays(comp_id, start_for_data, end_for_data) if engine == "dc_mle" else None
+    if used_matches is not None and len(used_matches):
+        # ملاءمة مشتركة: λ الأساسية من μ/home المُلاءمة بدل متوسطات الدوري الخام
+        dc_fit = fit_dixon_coles_joint(used_matches)
+        A, D, rho = dc_fit["A"], dc_fit["D"], dc_fit["rho"]
+        avg_home, avg_away = dc_fit["avg_home"], dc_fit["avg_away"]
+    else:
+        A, D, used_matches = build_iterative_team_factors(comp_id, start_for_data, end_for_data, league_avgs)
+        rho = fit_dc_rho_mle(used_matches, A, D, league_avgs)
 
     # 7) صاحب الأرض
     home_id = t1_id if team1_is_home else t2_id
     away_id = t2_id if team1_is_home else t1_id
 
     # 8) λ الأساسية
-    avg_home = league_avgs["avg_home_goals"]
-    avg_away = league_avgs["avg_away_goals"]
     Ah = A.get(home_id, 1.0); Dh = D.get(home_id, 1.0)
     Aa = A.get(away_id, 1.0); Da = D.get(away_id, 1.0)
     lam_home_base = avg_home * Ah * Da
     lam_away_base = avg_away * Aa * Dh
 
     # 9) ELO
-    ratings_all = build_elo_table(comp_id, start_for_data, end_for_data)
+    rating_fn = None
+    if ELO_SOURCE == "global":
+        # ELO عالمي عبر المواسم والمسابقات؛ المتوسط المرجعي = فرق هذه المسابقة
+        g_elo = global_elo()
+        comp_teams = set(get_competition_arrays(comp_id, start_for_data, end_for_data).team_ids.tolist()) | {home_id, away_id}
+        ratings_all = {tid: g_elo.rating_as_of(tid, end_for_data) for tid in comp_teams}
+        rating_fn = g_elo.rating_as_of
+    else:
+        ratings_all = build_elo_table(comp_id, start_for_data, end_for_data)
     Rh = ratings_all.get(home_id, 1500.0)
     Ra = ratings_all.get(away_id, 1500.0)
     sH, sA, Eh = elo_scales(Rh, Ra, elo_home_adv=50.0, scale=ELO_SCALE)
@@ -1939,14 +3698,16 @@ def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True,
     lam_away *= gfA * gaH  # هجوم الضيف × ميل خصمه للاستقبال
 
     # 10) فورم محسّن بجودة الخصوم (SoS)
-    f_home_form, home_form_points, home_form_count = get_recent_form_factor_sos(home_id, comp_id, start_for_data, end_for_data, ratings_all, take=5)
-    f_away_form, away_form_points, away_form_count = get_recent_form_factor_sos(away_id, comp_id, start_for_data, end_for_data, ratings_all, take=5)
+    f_home_form, home_form_points, home_form_count = get_recent_form_factor_sos(home_id, comp_id, start_for_data, end_for_data, ratings_all, take=5, rating_fn=rating_fn)
+    f_away_form, away_form_points, away_form_count = get_recent_form_factor_sos(away_id, comp_id, start_for_data, end_for_data, ratings_all, take=5, rating_fn=rating_fn)
     lam_home *= f_home_form
     lam_away *= f_away_form
 
     # 10b) معدل التهديف الحديث مقابل المتوقع
-    gr_home = recent_goal_rate_factor(home_id, comp_id, A, D, league_avgs, start_for_data, end_for_data, take=5)
-    gr_away = recent_goal_rate_factor(away_id, comp_id, A, D, league_avgs, start_for_data, end_for_data, take=5)
+    # λ المتوقعة تُبنى على نفس أساس A/D (متوسطات الدوري أو μ/home في dc_mle)
+    strength_avgs = {"avg_home_goals": avg_home, "avg_away_goals": avg_away}
+    gr_home = recent_goal_rate_factor(home_id, comp_id, A, D, strength_avgs, start_for_data, end_for_data, take=5)
+    gr_away = recent_goal_rate_factor(away_id, comp_id, A, D, strength_avgs, start_for_data, end_for_data, take=5)
     lam_home *= gr_home
     lam_away *= gr_away
 
@@ -2067,7 +3828,30 @@ def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True,
 
     # كيللي (اختياري) — باستخدام الاحتمالات المُعايرة
     kelly_1x2 = kelly_suggestions_1x2(p_home, p_draw, p_away, odds)
-    kelly_extra = kelly_suggestions_markets(mkts, odds)
+    kelly_extra = kelly_suggestions_markets(mkts, odds, market_engine=scoreline_engine.MarketEngine(M))
+
+    # الأشواط: حصص المسابقة + شبكة لكل شوط
+    half_shares = get_half_shares(comp_id, start_for_data, end_for_data)
+    htft = scoreline_engine.htft_markets(lam_home, lam_away, half_shares["home"], half_shares["away"], max_goals_used)
+    halves = {
+        "first_half_share": {"home": round(half_shares["home"], 4), "away": round(half_shares["away"], 4), "matches": half_shares["n"]},
+        "ht_1x2": {k: round(100 * float(htft[f"ht_{k}"][0]), 2) for k in ("home", "draw", "away")},
+        "ht_ft": {k: round(100 * float(v), 2) for k, v in zip(scoreline_engine.HTFT_KEYS, htft["htft"][0])},
+        "score_both_halves": {
+            "any": round(100 * float(htft["goal_both_halves"][0]), 2),
+            "home": round(100 * float(htft["home_scores_both_halves"][0]), 2),
+            "away": round(100 * float(htft["away_scores_both_halves"][0]), 2)
+        },
+        "highest_scoring_half": {k: round(100 * float(htft[f"highest_half_{k}"][0]), 2) for k in ("first", "equal", "second")}
+    }
+    kelly_htft = {}
+    htft_odds = _odds_lookup(odds, "ht_ft", "htft", "half_time_full_time", default={})
+    if isinstance(htft_odds, dict):
+        for k, p in zip(scoreline_engine.HTFT_KEYS, htft["htft"][0]):
+            o = _parse_odds_value(_odds_lookup(htft_odds, k, k.replace("/", "")))
+            if o:
+                kelly_htft[k] = _kelly_core(float(p), o)
+    kelly_htft = {k: v for k, v in kelly_htft.items() if v is not None}
 
     # بناء النتيجة
     result = {
@@ -2077,6 +3861,8 @@ def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True,
             "season_window": {"from": start_for_data, "to": end_for_data},
             "league_averages": league_avgs,
             "dc_rho": round(rho, 4),
+            "strength_engine": engine,
+            "elo_source": ELO_SOURCE,
             "prob_temperature": PROB_TEMP,
             "max_goals_grid": max_goals_used,
             "samples": {
@@ -2123,11 +3909,13 @@ def predict_match(team1_name: str, team2_name: str, team1_is_home: bool = True,
                 "away": round(100 * p_away, 2)
             },
             "top_scorelines": top5,
-            "markets": mkts
+            "markets": mkts,
+            "halves": halves
         },
         "kelly": {
             "on_1x2": kelly_1x2,
-            "on_markets": kelly_extra
+            "on_markets": kelly_extra,
+            "on_ht_ft": kelly_htft
         }
     }
     return result
@@ -2154,6 +3942,8 @@ def main():
     parser.add_argument("--recent_all_comps", type=str, default="false", help="لو true يجلب آخر المباريات من كل المسابقات")
     parser.add_argument("--squad_limit", type=int, default=0, help="حد أقصى لعدد اللاعبين المعروضين (0=بدون حد)")
     parser.add_argument("--scorers_limit", type=int, default=20, help="عدد هدّافي المسابقة المعروضين")
+    parser.add_argument("--engine", type=str, default=None, choices=["ratio", "dc_mle"], help="محرك قوى الفرق (الافتراضي FD_STRENGTH_ENGINE أو ratio)")
+    parser.add_argument("--plan", action="store_true", help="Dry-run: اعرض عدد طلبات API اللازمة لكل endpoint والزمن التقديري دون تنفيذ")
     args = parser.parse_args()
 
     t1 = args.team1.strip()
@@ -2167,6 +3957,11 @@ def main():
     env_comp = (os.getenv("FD_COMP") or os.getenv("COMP") or "").strip()
     comp = (args.comp or env_comp or "").strip().upper() or None
 
+    if args.plan:
+        plan = plan_prediction(t1, t2, competition_code_override=comp, scorers_limit=int(args.scorers_limit))
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
+        return
+
     odds = None
     if args.odds_json:
         try:
@@ -2182,15 +3977,18 @@ def main():
             log(f"تعذر قراءة extras_json: {e}")
 
     try:
-        out = predict_match(
-            t1, t2,
-            team1_is_home=t1h,
-            competition_code_override=comp,
-            odds=odds,
-            max_goals=max_goals,  # قد يكون None -> ديناميكي
-            extras=extras,
-            scorers_limit=int(args.scorers_limit)
-        )
+        # المستخدم ينتظر: أولوية تفاعلية
+        with request_priority(PRIORITY_INTERACTIVE):
+            out = predict_match(
+                t1, t2,
+                team1_is_home=t1h,
+                competition_code_override=comp,
+                odds=odds,
+                max_goals=max_goals,  # قد يكون None -> ديناميكي
+                extras=extras,
+                scorers_limit=int(args.scorers_limit),
+                engine=args.engine
+            )
 
         def _to_bool(x):
             return (str(x or "false").strip().lower() in ("true","1","yes","y"))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+# ==========================================================
+# 📌 إعدادات: تسجيل/إعادة تشغيل استجابات HTTP (Cassette)
+# ==========================================================
+# HTTP_CASSETTE=path.json  +  HTTP_CASSETTE_MODE=record|replay
+# - record: كل استجابة حقيقية تُحفظ في الملف (آخر استجابة لنفس المفتاح تفوز)
+# - replay: تُقدَّم الاستجابات من الملف بلا شبكة وبلا انتظار محدد المعدل
+CASSETTE_PATH = os.getenv("HTTP_CASSETTE", "")
+CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "").strip().lower()
+
+# باراميترات/ترويسات سرية لا تدخل في المفتاح ولا تُحفظ
+_SECRET_PARAMS = {"apikey", "api_key", "token"}
+_KEPT_HEADERS = {
+    "retry-after", "x-requests-available-minute", "x-requestcounter-reset",
+    "x-ratelimit-remaining", "x-requests-remaining", "x-requests-used",
+}
+
+
+class CassetteMiss(RuntimeError):
+    """ طلب غير موجود في الكاسيت أثناء replay. """
+
+
+class CassetteResponse:
+    """ استجابة مسجلة بواجهة مطابقة لما نستخدمه من requests.Response. """
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], body: Any):
+        self.url = url
+        self.status_code = status_code
+        self.headers = _CaseInsensitiveDict(headers or {})
+        self._body = body
+        self.text = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)
+
+    def json(self):
+        if isinstance(self._body, str):
+            return json.loads(self._body)
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} (cassette) for url: {self.url}", response=self)
+
+
+class _CaseInsensitiveDict(dict):
+    def __init__(self, d):
+        super().__init__({str(k).lower(): v for k, v in d.items()})
+
+    def get(self, key, default=None):
+        return super().get(str(key).lower(), default)
+
+    def __getitem__(self, key):
+        return super().__getitem__(str(key).lower())
+
+    def __contains__(self, key):
+        return super().__contains__(str(key).lower())
+
+
+# ==========================================================
+# 📌 الكاسيت نفسه
+# ==========================================================
+class Cassette:
+    def __init__(self, path: str, mode: str):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"HTTP_CASSETTE_MODE غير صالح: {mode!r} (record|replay)")
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = (json.load(f) or {}).get("entries", {})
+        elif mode == "replay":
+            raise FileNotFoundError(f"ملف الكاسيت غير موجود: {path}")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @staticmethod
+    def key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        items = sorted(
+            (str(k), str(v)) for k, v in (params or {}).items()
+            if v is not None and str(k).lower() not in _SECRET_PARAMS
+        )
+        return "GET " + url + ("?" + "&".join(f"{k}={v}" for k, v in items) if items else "")
+
+    def replay(self, url: str, params: Optional[Dict[str, Any]] = None) -> CassetteResponse:
+        k = self.key(url, params)
+        e = self.entries.get(k)
+        if e is None:
+            raise CassetteMiss(f"الطلب غير مسجل في الكاسيت: {k}")
+        return CassetteResponse(url, e["status"], e.get("headers") or {}, e.get("body"))
+
+    def record(self, url: str, params: Optional[Dict[str, Any]], resp) -> None:
+        try:
+            body = resp.json()
+        except Exception:
+            body = resp.text
+        headers = {k: v for k, v in (resp.headers or {}).items() if str(k).lower() in _KEPT_HEADERS}
+        with self.lock:
+            self.entries[self.key(url, params)] = {"status": resp.status_code, "headers": headers, "body": body}
+            self._save()
+
+    def _save(self) -> None:
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+# ==========================================================
+# 📌 الكاسيت الفعّال (من البيئة أو برمجياً)
+# ==========================================================
+_active: Optional[Cassette] = None
+_active_lock = threading.Lock()
+_env_loaded = False
+
+
+def active() -> Optional[Cassette]:
+    """ الكاسيت الفعّال حالياً أو None. """
+    global _active, _env_loaded
+    if not _env_loaded:
+        with _active_lock:
+            if not _env_loaded:
+                if CASSETTE_PATH and CASSETTE_MODE:
+                    _active = Cassette(CASSETTE_PATH, CASSETTE_MODE)
+                _env_loaded = True
+    return _active
+
+
+def replaying() -> bool:
+    c = active()
+    return c is not None and c.replaying
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "replay"):
+    """
+    تفعيل كاسيت مؤقتاً — مثال لقياس زمن النموذج دون شبكة:
+        with use_cassette("bench/pd.json", "replay"):
+            predict_match(...)
+    """
+    global _active
+    active()
+    prev = _active
+    _active = Cassette(path, mode)
+    try:
+        yield _active
+    finally:
+        _active = prev
@@ -4,6 +4,9 @@ import time
 import requests
 from typing import Dict, Any, List, Tuple
 
+import http_cassette
+from odds_math import aggregate_prices
+
 
 # ==========================================================
 # 📌 إعدادات أساسية
@@ -18,19 +21,27 @@ def _get(path: str, params: Dict[str, Any] = None, timeout: int = 20):
     # اقرأ المفتاح من البيئة عند كل استدعاء (ديناميكي)
     params = dict(params or {})
     apikey = params.pop("apiKey", None) or os.getenv("ODDS_API_KEY") or ""
-    if not apikey:
-        raise RuntimeError("ODDS_API_KEY غير مضبوط. ضعه في Secrets أو البيئة.")
-
     url = f"{BASE}{path}"
-    params["apiKey"] = apikey
 
-    r = requests.get(url, params=params, timeout=timeout)
+    # replay من كاسيت: بلا شبكة وبلا مفتاح وبلا انتظار
+    cassette = http_cassette.active()
+    if cassette is not None and cassette.replaying:
+        r = cassette.replay(url, params)
+    else:
+        if not apikey:
+            raise RuntimeError("ODDS_API_KEY غير مضبوط. ضعه في Secrets أو البيئة.")
+        params["apiKey"] = apikey
 
-    if r.status_code == 429:  # Too Many Requests
-        ra = int(r.headers.get("Retry-After", "60"))
-        time.sleep(ra)
         r = requests.get(url, params=params, timeout=timeout)
 
+        if r.status_code == 429:  # Too Many Requests
+            ra = int(r.headers.get("Retry-After", "60"))
+            time.sleep(ra)
+            r = requests.get(url, params=params, timeout=timeout)
+
+        if cassette is not None and cassette.recording:
+            cassette.record(url, params, r)
+
     r.raise_for_status()
     return r.json(), {
         "remaining": r.headers.get("x-requests-remaining"),
@@ -130,3 +141,75 @@ def extract_totals_lines(event: Dict[str, Any]) -> Dict[str, Dict[str, List[floa
             lines.pop(L, None)
 
     return lines
+
+
+# ==========================================================
+# 📌 استخراج خطوط الهانديكاب الآسيوي (Spreads)
+# ==========================================================
+def extract_spreads_lines(event: Dict[str, Any]) -> Dict[str, Dict[str, List[float]]]:
+    """ {خط صاحب الأرض: {"home": [...], "away": [...]}} — خط الضيف هو عكس المفتاح. """
+    home, away = event.get("home_team"), event.get("away_team")
+    lines: Dict[str, Dict[str, List[float]]] = {}
+
+    for bm in event.get("bookmakers", []):
+        for m in bm.get("markets", []):
+            if m.get("key") == "spreads":
+                for o in m.get("outcomes", []):
+                    n = o.get("name")
+                    price = o.get("price")
+                    try:
+                        point = float(o.get("point"))
+                    except (TypeError, ValueError):
+                        continue
+
+                    if n == home:
+                        side, home_point = "home", point
+                    elif n == away:
+                        side, home_point = "away", -point
+                    else:
+                        continue
+
+                    key = str(home_point + 0.0)
+                    if key not in lines:
+                        lines[key] = {"home": [], "away": []}
+                    lines[key][side].append(price)
+
+    # تنظيف
+    for L in list(lines.keys()):
+        for side in ("home", "away"):
+            lines[L][side] = [
+                p for p in lines[L][side] if isinstance(p, (int, float)) and float(p) > 1.0
+            ]
+        if not lines[L]["home"] and not lines[L]["away"]:
+            lines.pop(L, None)
+
+    return lines
+
+
+# ==========================================================
+# 📌 أودز الحدث بصيغة fd_predictor (لاقتراحات كيللي من النموذج)
+# ==========================================================
+def event_model_odds(event: Dict[str, Any], mode: str = "median") -> Dict[str, Any]:
+    """
+    يجمع أسعار الدفاتر (h2h + totals + spreads) في قاموس odds الذي يقبله
+    fd_predictor.predict_match: 1X2 مباشرة، "ou" و"asian_handicap" بصيغة {خط: {جهة: سعر}}.
+    """
+    out: Dict[str, Any] = {}
+    for side, arr in extract_h2h_prices(event).items():
+        price = aggregate_prices(arr, mode=mode)
+        if price:
+            out[side] = price
+
+    for key, lines, sides in (
+        ("ou", extract_totals_lines(event), ("over", "under")),
+        ("asian_handicap", extract_spreads_lines(event), ("home", "away")),
+    ):
+        agg = {}
+        for L, prices in lines.items():
+            row = {s: aggregate_prices(prices[s], mode=mode) for s in sides}
+            row = {s: p for s, p in row.items() if p}
+            if row:
+                agg[L] = row
+        if agg:
+            out[key] = agg
+    return out
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+import math
+from functools import cached_property, lru_cache
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+
+# ==========================================================
+# 📌 جدول log(k!) مشترك (يتوسع عند الحاجة)
+# ==========================================================
+_LOG_FACT = np.array([math.lgamma(k + 1) for k in range(32)])
+
+
+def log_factorial(n: int) -> np.ndarray:
+    """ log(k!) لـ k = 0..n (من جدول محسوب مسبقاً). """
+    global _LOG_FACT
+    if n + 1 > len(_LOG_FACT):
+        _LOG_FACT = np.array([math.lgamma(k + 1) for k in range(max(n + 1, 2 * len(_LOG_FACT)))])
+    return _LOG_FACT[: n + 1]
+
+
+def poisson_pmf_vector(lam: float, max_goals: int) -> np.ndarray:
+    """ P(k; λ) لـ k = 0..max_goals — نفس poisson_pmf لكن كمتجه واحد. """
+    if lam <= 0:
+        out = np.zeros(max_goals + 1)
+        out[0] = 1.0
+        return out
+    k = np.arange(max_goals + 1)
+    return np.exp(k * math.log(lam) - lam - log_factorial(max_goals))
+
+
+def dynamic_max_goals(lh: float, la: float) -> int:
+    """ حجم الشبكة الديناميكي حسب أكبر λ (بين 8 و 15). """
+    m = max(lh, la, 1e-6)
+    return max(8, int(min(15, round(m + 6 * math.sqrt(m)))))
+
+
+# ==========================================================
+# 📌 مصفوفة النتائج (بواسون × بواسون + تصحيح Dixon-Coles)
+# ==========================================================
+def score_matrix(lh: float, la: float, rho: float = 0.0, max_goals: int = 10) -> np.ndarray:
+    """ M[i, j] = P(home=i, away=j): ضرب خارجي لمتجهي pmf ثم τ على الخلايا الأربع ثم تطبيع. """
+    M = np.outer(poisson_pmf_vector(lh, max_goals), poisson_pmf_vector(la, max_goals))
+    if max_goals >= 0:
+        M[0, 0] *= max(0.001, 1.0 - rho * lh * la)
+    if max_goals >= 1:
+        M[0, 1] *= max(0.001, 1.0 + rho * lh)
+        M[1, 0] *= max(0.001, 1.0 + rho * la)
+        M[1, 1] *= max(0.001, 1.0 - rho)
+    s = M.sum()
+    if s > 0:
+        M /= s
+    return M
+
+
+def draw_prob_independent(lh: float, la: float, max_goals: int = 10) -> float:
+    return float(poisson_pmf_vector(lh, max_goals).dot(poisson_pmf_vector(la, max_goals)))
+
+
+# ==========================================================
+# 📌 اختزالات المصفوفة: 1X2 (مثلثات) والمجاميع (أقطار معاكسة)
+# ==========================================================
+def outcome_probs(M: np.ndarray) -> Tuple[float, float, float]:
+    """ (فوز المضيف، تعادل، فوز الضيف) = المثلث السفلي، القطر، المثلث العلوي. """
+    return float(np.tril(M, -1).sum()), float(np.trace(M)), float(np.triu(M, 1).sum())
+
+
+def total_goals_dist(M: np.ndarray) -> np.ndarray:
+    """ P(مجموع الأهداف = t) لـ t = 0..2n: مجموع كل قطر معاكس. """
+    n = M.shape[0] - 1
+    i, j = np.indices(M.shape)
+    return np.bincount((i + j).ravel(), weights=M.ravel(), minlength=2 * n + 1)
+
+
+def top_scores(M: np.ndarray, k: int = 5) -> List[Dict]:
+    """ أعلى k نتائج (ترتيب مستقر: عند التساوي الأسبق صفاً ثم عموداً). """
+    flat = M.ravel()
+    order = np.argsort(-flat, kind="stable")[:k]
+    n1 = M.shape[1]
+    return [{"score": f"{idx // n1}-{idx % n1}", "prob": round(100 * float(flat[idx]), 2)} for idx in order]
+
+
+def matrix_to_outcomes(M) -> Tuple[float, float, float, List[Dict]]:
+    M = np.asarray(M, dtype=float)
+    p_home, p_draw, p_away = outcome_probs(M)
+    return p_home, p_draw, p_away, top_scores(M, 5)
+
+
+def matrix_markets(M) -> Dict:
+    """ BTTS/شباك نظيفة/Over-Under (1.5, 2.5, 3.5) بنفس صيغة المخرجات السابقة (نصوص نسب مئوية). """
+    M = np.asarray(M, dtype=float)
+    p_btts = float(M[1:, 1:].sum())
+    p_clean_home = float(M[:, 0].sum())
+    p_clean_away = float(M[0, :].sum())
+    cum_total = np.cumsum(total_goals_dist(M))
+
+    ou_lines = {}
+    for line in [1.5, 2.5, 3.5]:
+        floor = int(math.floor(line))
+        u = float(cum_total[min(floor, len(cum_total) - 1)])
+        o = 1.0 - u
+        ou_lines[str(line)] = {"over": round(100 * o, 1), "under": round(100 * u, 1)}
+    return {
+        "BTTS_yes": f"{round(100 * p_btts, 1)}%",
+        "clean_sheet_home": f"{round(100 * p_clean_home, 1)}%",
+        "clean_sheet_away": f"{round(100 * p_clean_away, 1)}%",
+        "over_under": ou_lines,
+    }
+
+
+# ==========================================================
+# 📌 محرك الأسواق: كل الخطوط من نفس المصفوفة (كسول، مصفوفات float)
+# ==========================================================
+# نتائج التسوية بوحدة الرهان: ربح كامل، نصف ربح، استرداد، نصف خسارة، خسارة
+SETTLE_OUTCOMES = ("win", "half_win", "push", "half_loss", "loss")
+_SETTLE_R = np.array([1.0, 0.5, 0.0, -0.5, -1.0])
+
+
+def parse_line(line: Union[str, float]) -> float:
+    """ خط رقمي من "2.25" أو "-0.5,-1" / "2/2.5" (الصيغة المقسومة = المتوسط). """
+    if isinstance(line, (int, float)):
+        return float(line)
+    s = str(line).strip().replace(" ", "")
+    for sep in (",", "/"):
+        if sep in s:
+            a, b = s.split(sep, 1)
+            return 0.5 * (float(a) + float(b))
+    return float(s)
+
+
+def settle_probs(values: np.ndarray, probs: np.ndarray, handicap: float) -> np.ndarray:
+    """
+    يسوّي رهان "values + handicap > 0" على توزيع منفصل → [win, half_win, push, half_loss, loss].
+    الخطوط الربعية (±0.25, ±0.75, ...) تُقسم نصفين على handicap ± 0.25.
+    خط خارج شبكة الأرباع (مثل 2.1) → ValueError بدل تسعير سوق آخر.
+    """
+    q = int(round(4 * handicap))
+    if abs(4 * handicap - q) > 1e-9:
+        raise ValueError(f"line not on the quarter grid: {handicap}")
+    if q % 2:
+        r = 0.5 * np.sign(values + (q - 1) / 4.0) + 0.5 * np.sign(values + (q + 1) / 4.0)
+    else:
+        r = np.sign(values + q / 4.0)
+    return np.array([probs[r == k].sum() for k in _SETTLE_R])
+
+
+def settle_ev(outcomes: np.ndarray, odds_dec: float) -> float:
+    """ العائد المتوقع لكل وحدة رهان بأودز عشرية. """
+    b = odds_dec - 1.0
+    return float(outcomes[0] * b + outcomes[1] * 0.5 * b - outcomes[3] * 0.5 - outcomes[4])
+
+
+def effective_prob(outcomes: np.ndarray, odds_dec: float) -> float:
+    """ احتمال رهان ثنائي بنفس الأودز ونفس العائد المتوقع: (EV + 1) / odds. """
+    return (settle_ev(outcomes, odds_dec) + 1.0) / odds_dec
+
+
+class MarketEngine:
+    """
+    أسواق مشتقة من مصفوفة نتائج واحدة: التوزيعات الهامشية تُحسب مرة عند أول طلب،
+    وكل خط (مجاميع، هانديكاب آسيوي، مجاميع الفريق...) تسوية سريعة فوقها.
+    """
+
+    def __init__(self, M):
+        self.M = np.asarray(M, dtype=float)
+        self.n = self.M.shape[0] - 1
+
+    @cached_property
+    def home_goals(self) -> np.ndarray:
+        return self.M.sum(axis=1)
+
+    @cached_property
+    def away_goals(self) -> np.ndarray:
+        return self.M.sum(axis=0)
+
+    @cached_property
+    def total_goals(self) -> np.ndarray:
+        return total_goals_dist(self.M)
+
+    @cached_property
+    def margins(self) -> np.ndarray:
+        """ قيم فارق الأهداف (مضيف − ضيف) من −n إلى n. """
+        return np.arange(-self.n, self.n + 1)
+
+    @cached_property
+    def margin_dist(self) -> np.ndarray:
+        """ P(فارق = margins[k]). """
+        i, j = np.indices(self.M.shape)
+        return np.bincount((i - j + self.n).ravel(), weights=self.M.ravel(), minlength=2 * self.n + 1)
+
+    @cached_property
+    def one_x_two(self) -> np.ndarray:
+        return np.array(outcome_probs(self.M))
+
+    def totals(self, line, side: str = "over", team: str = None) -> np.ndarray:
+        """ أي خط مجاميع (بما فيها الربعية)؛ team = "home"/"away" لمجاميع الفريق. """
+        line = parse_line(line)
+        dist = {"home": self.home_goals, "away": self.away_goals}.get(team, self.total_goals)
+        goals = np.arange(len(dist))
+        if side == "over":
+            return settle_probs(goals, dist, -line)
+        return settle_probs(-goals, dist, line)
+
+    def asian_handicap(self, line, side: str = "home") -> np.ndarray:
+        """ هانديكاب آسيوي كامل/نصفي/ربعي؛ line من منظور الجهة المختارة. """
+        line = parse_line(line)
+        values = self.margins if side == "home" else -self.margins
+        return settle_probs(values, self.margin_dist, line)
+
+    def draw_no_bet(self, side: str = "home") -> np.ndarray:
+        return self.asian_handicap(0.0, side)
+
+    def double_chance(self) -> np.ndarray:
+        """ [1X, 12, X2]. """
+        h, d, a = self.one_x_two
+        return np.array([h + d, h + a, d + a])
+
+    def winning_margin(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ (القيم، الاحتمالات) لفارق الأهداف الدقيق. """
+        return self.margins, self.margin_dist
+
+    def correct_score(self) -> np.ndarray:
+        """ دفتر النتائج الكامل: M[i, j]. """
+        return self.M
+
+    def combos(self, combos) -> np.ndarray:
+        """ احتمالات تركيبات نفس المباراة (انظر price_combos). """
+        return price_combos(self.M, combos)
+
+
+# ==========================================================
+# 📌 تركيبات نفس المباراة: كل ساق = قناع منطقي على الشبكة
+# ==========================================================
+def _combo_split(combo) -> List[str]:
+    """ "home & over_2.5" أو ["home", "over_2.5"] → أسماء السيقان. """
+    if isinstance(combo, str):
+        combo = combo.replace("+", "&").split("&")
+    return [str(x).strip().lower() for x in combo if str(x).strip()]
+
+
+@lru_cache(maxsize=32)
+def leg_masks(max_goals: int) -> Tuple[Dict[str, int], np.ndarray]:
+    """
+    كل السيقان المعروفة لشبكة (G+1)×(G+1): (اسم → فهرس، مصفوفة K×(G+1)² منطقية).
+    محسوبة مرة لكل حجم شبكة؛ الفهرس 0 = "any" (صحيح دائماً) لحشو التركيبات القصيرة.
+    """
+    i, j = np.indices((max_goals + 1, max_goals + 1))
+    t = i + j
+    legs = {
+        "any": np.ones_like(t, dtype=bool),
+        "home": i > j, "draw": i == j, "away": i < j,
+        "1x": i >= j, "12": i != j, "x2": i <= j,
+        "btts": (i > 0) & (j > 0), "btts_no": (i == 0) | (j == 0),
+        "clean_sheet_home": j == 0, "clean_sheet_away": i == 0,
+        "home_win_to_nil": (i > j) & (j == 0), "away_win_to_nil": (j > i) & (i == 0),
+        "odd": t % 2 == 1, "even": t % 2 == 0,
+    }
+    for k in range(2 * max_goals):
+        legs[f"over_{k}.5"] = t > k
+        legs[f"under_{k}.5"] = t <= k
+    for k in range(max_goals):
+        legs[f"home_over_{k}.5"] = i > k
+        legs[f"home_under_{k}.5"] = i <= k
+        legs[f"away_over_{k}.5"] = j > k
+        legs[f"away_under_{k}.5"] = j <= k
+    for k in range(1, max_goals + 1):
+        legs[f"home_by_{k}"] = i - j == k
+        legs[f"away_by_{k}"] = j - i == k
+    for a in range(max_goals + 1):
+        for b in range(max_goals + 1):
+            legs[f"score_{a}-{b}"] = (i == a) & (j == b)
+    index = {name: k for k, name in enumerate(legs)}
+    masks = np.stack([m.ravel() for m in legs.values()])
+    masks.setflags(write=False)
+    return index, masks
+
+
+def unknown_combo_legs(combo, max_goals: int) -> List[str]:
+    """ سيقان التركيبة غير المعروفة لهذه الشبكة (قائمة فارغة = تركيبة صالحة). """
+    index, _ = leg_masks(max_goals)
+    return [leg for leg in _combo_split(combo) if leg not in index]
+
+
+def combo_masks(combos, max_goals: int) -> np.ndarray:
+    """ مصفوفة C×(G+1)² منطقية: AND لسيقان كل تركيبة (عبر فهارس محشوة بـ "any"). """
+    index, masks = leg_masks(max_goals)
+    parts = [_combo_split(c) for c in combos]
+    width = max([len(p) for p in parts] + [1])
+    idx = np.zeros((len(parts), width), dtype=int)
+    for r, legs in enumerate(parts):
+        for c, leg in enumerate(legs):
+            if leg not in index:
+                raise ValueError(f"unknown combo leg: {leg}")
+            idx[r, c] = index[leg]
+    return masks[idx].all(axis=1)
+
+
+def price_combos(M, combos) -> np.ndarray:
+    """
+    احتمالات التركيبات بدقة من التوزيع المشترك (لا ضرب هامشيات).
+    M مصفوفة (G+1)×(G+1) → متجه C، أو موتر N×(G+1)×(G+1) → مصفوفة N×C.
+    """
+    M = np.asarray(M, dtype=float)
+    g1 = M.shape[-1]
+    C = combo_masks(list(combos), g1 - 1).astype(float)
+    if M.ndim == 2:
+        return C @ M.ravel()
+    return M.reshape(M.shape[0], -1) @ C.T
+
+
+# ==========================================================
+# 📌 دفعات: موترات N×G×G لعدة مباريات دفعة واحدة
+# ==========================================================
+def poisson_pmf_rows(lams, max_goals: int) -> np.ndarray:
+    """ مصفوفة N×(G+1): صف pmf لكل λ (λ <= 0 → كل الكتلة عند 0). """
+    lams = np.asarray(lams, dtype=float)
+    k = np.arange(max_goals + 1)
+    safe = np.where(lams > 0, lams, 1.0)
+    P = np.exp(k[None, :] * np.log(safe)[:, None] - safe[:, None] - log_factorial(max_goals)[None, :])
+    P[lams <= 0] = 0.0
+    P[lams <= 0, 0] = 1.0
+    return P
+
+
+def batch_max_goals(lh, la) -> int:
+    """ شبكة مشتركة = أكبر dynamic_max_goals بين المباريات (= قيمتها عند أكبر λ لأنها غير متناقصة). """
+    lh = np.asarray(lh, dtype=float)
+    la = np.asarray(la, dtype=float)
+    if not lh.size:
+        return dynamic_max_goals(0.0, 0.0)
+    return dynamic_max_goals(float(lh.max()), float(la.max()))
+
+
+def score_tensor(lh, la, rho=0.0, max_goals: int = None) -> np.ndarray:
+    """
+    T[n, i, j] = P(home=i, away=j) للمباراة n — نفس score_matrix لكل صف لكن بعملية واحدة.
+    rho رقم أو متجه؛ max_goals=None → batch_max_goals.
+    """
+    lh = np.atleast_1d(np.asarray(lh, dtype=float))
+    la = np.atleast_1d(np.asarray(la, dtype=float))
+    rho = np.broadcast_to(np.asarray(rho, dtype=float), lh.shape)
+    G = batch_max_goals(lh, la) if max_goals is None else max_goals
+    T = poisson_pmf_rows(lh, G)[:, :, None] * poisson_pmf_rows(la, G)[:, None, :]
+    T[:, 0, 0] *= np.maximum(0.001, 1.0 - rho * lh * la)
+    if G >= 1:
+        T[:, 0, 1] *= np.maximum(0.001, 1.0 + rho * lh)
+        T[:, 1, 0] *= np.maximum(0.001, 1.0 + rho * la)
+        T[:, 1, 1] *= np.maximum(0.001, 1.0 - rho)
+    s = T.sum(axis=(1, 2))
+    T /= np.where(s > 0, s, 1.0)[:, None, None]
+    return T
+
+
+def _batch_diagonal_sums(T: np.ndarray, cell_bin: np.ndarray) -> np.ndarray:
+    """ N×(2G+1): مجموع خلايا كل مباراة حسب فهرس القطر cell_bin — bincount واحد بإزاحة لكل مباراة. """
+    N, g1, _ = T.shape
+    nb = 2 * g1 - 1
+    bins = (np.arange(N)[:, None] * nb + cell_bin[None, :]).ravel()
+    return np.bincount(bins, weights=T.ravel(), minlength=N * nb).reshape(N, nb)
+
+
+def batch_total_goals(T: np.ndarray) -> np.ndarray:
+    """ N×(2G+1): توزيع مجموع الأهداف لكل مباراة (أقطار معاكسة). """
+    N, g1, _ = T.shape
+    i, j = np.indices((g1, g1))
+    return _batch_diagonal_sums(T, (i + j).ravel())
+
+
+def batch_markets(T: np.ndarray, lines=(1.5, 2.5, 3.5)) -> Dict[str, np.ndarray]:
+    """ متجهات أسواق (طول N، احتمالات عشرية) لكل المباريات من الموتر. """
+    g1 = T.shape[1]
+    lower = np.tril(np.ones((g1, g1), dtype=bool), -1)
+    cum_total = np.cumsum(batch_total_goals(T), axis=1)
+    out = {
+        "home": T[:, lower].sum(axis=1),
+        "draw": np.trace(T, axis1=1, axis2=2),
+        "away": T[:, lower.T].sum(axis=1),
+        "btts": T[:, 1:, 1:].sum(axis=(1, 2)),
+        "clean_sheet_home": T[:, :, 0].sum(axis=1),
+        "clean_sheet_away": T[:, 0, :].sum(axis=1),
+    }
+    for line in lines:
+        u = cum_total[:, min(int(math.floor(line)), cum_total.shape[1] - 1)]
+        out[f"over_{line}"] = 1.0 - u
+        out[f"under_{line}"] = u
+    return out
+
+
+def price_fixtures(lh, la, rho=0.0, max_goals: int = None, lines=(1.5, 2.5, 3.5)) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """ واجهة الدفعات: (الموتر N×G×G، متجهات الأسواق). """
+    T = score_tensor(lh, la, rho, max_goals)
+    return T, batch_markets(T, lines)
+
+
+# ==========================================================
+# 📌 الأشواط: شبكة بواسون لكل شوط + أسواق HT/FT (دفعات)
+# ==========================================================
+HTFT_KEYS = ("1/1", "1/X", "1/2", "X/1", "X/X", "X/2", "2/1", "2/X", "2/2")
+
+
+def _batch_margins(T: np.ndarray) -> np.ndarray:
+    """ N×(2G+1): توزيع فارق الأهداف (مضيف − ضيف) من −G إلى G. """
+    N, g1, _ = T.shape
+    i, j = np.indices((g1, g1))
+    return _batch_diagonal_sums(T, (i - j + g1 - 1).ravel())
+
+
+def half_tensors(lh, la, share_home, share_away, max_goals: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    موترا الشوطين: λ الشوط الأول = λ × حصته، والثاني = الباقي (بواسون مستقل لكل شوط).
+    share_* رقم أو متجه بطول N.
+    """
+    lh = np.atleast_1d(np.asarray(lh, dtype=float))
+    la = np.atleast_1d(np.asarray(la, dtype=float))
+    sh = np.broadcast_to(np.asarray(share_home, dtype=float), lh.shape)
+    sa = np.broadcast_to(np.asarray(share_away, dtype=float), la.shape)
+    G = batch_max_goals(lh, la) if max_goals is None else max_goals
+    T1 = score_tensor(lh * sh, la * sa, 0.0, G)
+    T2 = score_tensor(lh * (1.0 - sh), la * (1.0 - sa), 0.0, G)
+    return T1, T2
+
+
+def htft_markets(lh, la, share_home, share_away, max_goals: int = None) -> Dict[str, np.ndarray]:
+    """
+    أسواق الأشواط لكل المباريات دفعة واحدة (احتمالات عشرية، متجهات طول N):
+    نتيجة الشوط الأول، HT/FT (مصفوفة N×9 بترتيب HTFT_KEYS)، التسجيل في الشوطين، الشوط الأعلى تهديفاً.
+    """
+    T1, T2 = half_tensors(lh, la, share_home, share_away, max_goals)
+    N, g1, _ = T1.shape
+    d = np.arange(-(g1 - 1), g1)  # قيم الفارق في كل شوط
+
+    # فارق النهاية = d1 + d2: لكل قيمة d1 نحتاج P(d2 > −d1)، P(d2 = −d1)، P(d2 < −d1)
+    m1, m2 = _batch_margins(T1), _batch_margins(T2)
+    cdf2 = np.cumsum(m2, axis=1)
+    k = (-d) + (g1 - 1)  # فهرس −d1 داخل m2
+    eq = m2[:, k]
+    lt = np.where(k > 0, cdf2[:, np.maximum(k - 1, 0)], 0.0)
+    gt = 1.0 - lt - eq
+    ft_given = np.stack([gt, eq, lt], axis=2)  # N×(2G+1)×3: (1، X، 2) بشرط d1
+    ht_class = [d > 0, d == 0, d < 0]
+    htft = np.concatenate([(m1[:, c, None] * ft_given[:, c, :]).sum(axis=1) for c in ht_class], axis=1)
+
+    # مجاميع كل شوط → الشوط الأعلى تهديفاً
+    t1, t2 = batch_total_goals(T1), batch_total_goals(T2)
+    cdf_t2 = np.cumsum(t2, axis=1)
+    p_eq = (t1 * t2).sum(axis=1)
+    p_first = (t1[:, 1:] * cdf_t2[:, :-1]).sum(axis=1)
+
+    h1_home, h1_away = T1.sum(axis=2)[:, 0], T1.sum(axis=1)[:, 0]  # P(لا أهداف) لكل فريق في الشوط
+    h2_home, h2_away = T2.sum(axis=2)[:, 0], T2.sum(axis=1)[:, 0]
+    return {
+        "ht_home": htft[:, 0:3].sum(axis=1),
+        "ht_draw": htft[:, 3:6].sum(axis=1),
+        "ht_away": htft[:, 6:9].sum(axis=1),
+        "htft": htft,
+        "goal_both_halves": (1.0 - T1[:, 0, 0]) * (1.0 - T2[:, 0, 0]),
+        "home_scores_both_halves": (1.0 - h1_home) * (1.0 - h2_home),
+        "away_scores_both_halves": (1.0 - h1_away) * (1.0 - h2_away),
+        "highest_half_first": p_first,
+        "highest_half_equal": p_eq,
+        "highest_half_second": 1.0 - p_first - p_eq,
+    }
@@ -171,7 +171,7 @@ with left:
         "مناطق الدفاتر (regions)", ["eu", "uk", "us", "au"], default=["eu", "uk"]
     )
     markets_sel = st.multiselect(
-        "الأسواق", ["h2h", "totals"], default=["h2h", "totals"]
+        "الأسواق", ["h2h", "totals", "spreads"], default=["h2h", "totals"]
     )
 
     if st.button("جلب المباريات والأودز"):
@@ -341,6 +341,52 @@ if events_data and events_data.get("events"):
         st.info("لا توجد خطوط Over/Under متاحة.")
     st.markdown("</div>", unsafe_allow_html=True)
 
+    # Spreads (هانديكاب آسيوي) — الخط من منظور صاحب الأرض
+    spreads_lines = odds_api.extract_spreads_lines(event)
+    st.markdown("<div class='card'>", unsafe_allow_html=True)
+    st.subheader("هانديكاب آسيوي — الخطوط المتاحة")
+
+    ah_line = None
+    odds_ah = fair_ah = ov_ah = sugg_ah = None
+
+    if spreads_lines:
+        ah_sorted = sorted(spreads_lines.keys(), key=lambda x: float(x))
+        ah_line = st.selectbox("اختر خط الهانديكاب (صاحب الأرض)", ah_sorted, index=0)
+        odds_ah = {
+            "home": aggregate_prices(spreads_lines[ah_line]["home"], mode=agg_mode),
+            "away": aggregate_prices(spreads_lines[ah_line]["away"], mode=agg_mode),
+        }
+        st.write(f"أسعار مجمعة لخط {ah_line}:", odds_ah)
+        imps_ah = implied_from_decimal({k: v for k, v in odds_ah.items() if v})
+        fair_ah = (
+            shin_fair_probs(imps_ah)
+            if fair_method == "Shin"
+            else normalize_proportional(imps_ah)
+        )
+        ov_ah = overround(imps_ah)
+        c_ah1, c_ah2 = st.columns(2)
+        with c_ah1:
+            st.metric(f"Home {ah_line}", f"{100 * fair_ah.get('home', 0):.2f}%")
+        with c_ah2:
+            st.metric(f"Away {-float(ah_line):+g}", f"{100 * fair_ah.get('away', 0):.2f}%")
+
+        st.markdown(
+            f"<span class='chip'>Overround: {ov_ah:.3f}</span>",
+            unsafe_allow_html=True,
+        )
+        sugg_ah = kelly_suggestions(
+            fair_ah,
+            {k: v for k, v in odds_ah.items() if v},
+            bankroll=bankroll,
+            kelly_scale=kelly_scale,
+            min_edge=min_edge,
+        )
+        st.subheader("اقتراحات كيللي (هانديكاب آسيوي)")
+        st.json(sugg_ah if sugg_ah else {"info": "لا اقتراحات ضمن الشروط"})
+    else:
+        st.info("لا توجد خطوط هانديكاب متاحة (فعّل سوق spreads عند الجلب).")
+    st.markdown("</div>", unsafe_allow_html=True)
+
     # لقطة JSON + تنزيل
     analysis_payload = {
         "context": {
@@ -373,6 +419,16 @@ if events_data and events_data.get("events"):
             "selected_overround": ov_ou,
             "kelly_suggestions": sugg_ou,
         },
+        "spreads": {
+            "all_lines": spreads_lines,
+            "selected_line": ah_line,
+            "selected_odds": odds_ah,
+            "selected_fair": fair_ah,
+            "selected_overround": ov_ah,
+            "kelly_suggestions": sugg_ah,
+        },
+        # صيغة odds لـ fd_predictor.predict_match (1X2 + ou + asian_handicap)
+        "model_odds": odds_api.event_model_odds(event, mode=agg_mode),
     }
     st.session_state["snapshot"] = analysis_payload
     st.download_button(
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+
+# fd_predictor يتطلب مفتاح API عند الاستيراد؛ الاختبارات لا تتصل بالشبكة
+os.environ.setdefault("FOOTBALL_DATA_API_KEY", "test")
+os.environ.setdefault("FD_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix="fd_tests_"), "cache.sqlite3"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
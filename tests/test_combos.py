@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import fd_predictor
+import scoreline_engine
+
+
+def test_invalid_combo_does_not_drop_valid_ones():
+    M = scoreline_engine.score_matrix(1.7, 0.9, -0.05, 10)
+    eng = scoreline_engine.MarketEngine(M)
+    odds = {"combos": {"home & over_2.5": 10.0, "home & over_2.25": 10.0}}
+
+    res = fd_predictor.kelly_suggestions_markets({}, odds, market_engine=eng)
+
+    combos = res["combos"]
+    assert list(combos) == ["home & over_2.5"]
+    p = float(eng.combos(["home & over_2.5"])[0])
+    assert abs(combos["home & over_2.5"]["prob"] - round(p, 4)) < 1e-9
+
+
+def test_unknown_combo_legs():
+    assert scoreline_engine.unknown_combo_legs("home & over_2.25", 10) == ["over_2.25"]
+    assert scoreline_engine.unknown_combo_legs("btts + draw", 10) == []
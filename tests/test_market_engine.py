@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import fd_predictor
+import scoreline_engine
+
+
+def _engine():
+    return scoreline_engine.MarketEngine(scoreline_engine.score_matrix(1.7, 0.9, -0.05, 10))
+
+
+def test_off_grid_lines_are_rejected():
+    eng = _engine()
+    with pytest.raises(ValueError):
+        eng.asian_handicap(-0.3)
+    with pytest.raises(ValueError):
+        eng.totals(2.1)
+    assert abs(eng.asian_handicap(-0.75).sum() - 1.0) < 1e-12
+
+
+def test_kelly_skips_off_grid_lines_only():
+    odds = {
+        "asian_handicap": {"-0.3": {"home": 5.0}, "-0.75": {"home": 5.0}},
+        "ou": {"2.1": {"over": 5.0}, "2.25": {"over": 5.0}},
+    }
+    res = fd_predictor.kelly_suggestions_markets({}, odds, market_engine=_engine())
+    assert list(res["asian_handicap"]) == ["-0.75"]
+    assert list(res["over_under_lines"]) == ["2.25"]
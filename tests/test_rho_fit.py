@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy as np
+
+import fd_predictor
+import scoreline_engine
+
+
+def _simulated_matches(n, lh, la, rho, seed=7):
+    """ n مباراة بين 20 فريقاً متساوين (A = D = 1) من شبكة Dixon-Coles معروفة. """
+    M = scoreline_engine.score_matrix(lh, la, rho, 10)
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(M.size, size=n, p=M.ravel())
+    recs = []
+    for k, c in enumerate(cells):
+        h, a = k % 20, (k + 1 + k // 20) % 20
+        if h == a:
+            a = (a + 1) % 20
+        day = 738000 + k // 10
+        recs.append(fd_predictor.MatchRec(k + 1, day, day * 86400, 100 + h, 100 + a, int(c // 11), int(c % 11), None, None, "FINISHED", None, 1))
+    return recs
+
+
+def _grid_rho(recs, lh, la, rho_max, steps=6001):
+    """ rho المرجعي ببحث شبكي على حدود log τ فقط (بقية log-likelihood لا تعتمد على rho). """
+    hg = np.array([m.hg for m in recs])
+    ag = np.array([m.ag for m in recs])
+    x00, lh01, la10, n11 = fd_predictor._dc_low_score_terms(hg, ag, np.full(len(hg), lh), np.full(len(hg), la))
+    # الحدود متطابقة (A = D = 1) → كل مجموعة = عدد × log(...)
+    grid = np.linspace(-rho_max, rho_max, steps)
+    ll = (len(x00) * np.log(1.0 - grid * lh * la) + len(lh01) * np.log(1.0 + grid * lh)
+          + len(la10) * np.log(1.0 + grid * la) + n11 * np.log(1.0 - grid))
+    return grid[np.argmax(ll)]
+
+
+def test_rho_fit_matches_grid_and_is_fast():
+    lh, la, true_rho = 1.5, 1.1, -0.12
+    recs = _simulated_matches(20000, lh, la, true_rho)
+    ones = {100 + t: 1.0 for t in range(20)}
+    avgs = {"avg_home_goals": lh, "avg_away_goals": la}
+
+    fd_predictor.fit_dc_rho_mle(recs, ones, ones, avgs)  # إحماء
+    t0 = time.perf_counter()
+    rho = fd_predictor.fit_dc_rho_mle(recs, ones, ones, avgs)
+    elapsed = time.perf_counter() - t0
+
+    rho_grid = _grid_rho(recs, lh, la, fd_predictor.DC_RHO_MAX)
+    assert abs(rho - rho_grid) < 2e-4
+    assert abs(rho - true_rho) < 0.05
+    # حد زمني متساهل: بناء الأعمدة + Brent على 20k مباراة
+    assert elapsed < 1.0, f"rho fit took {elapsed:.3f}s"
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import scoreline_engine
+
+
+def _fixtures(n=40, seed=11):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.2, 3.8, n), rng.uniform(0.2, 3.2, n), rng.uniform(-0.25, 0.25, n)
+
+
+def test_shared_grid_uses_dynamic_max_goals():
+    lh, la, _ = _fixtures()
+    expected = max(scoreline_engine.dynamic_max_goals(h, a) for h, a in zip(lh, la))
+    assert scoreline_engine.batch_max_goals(lh, la) == expected
+
+
+def test_batch_matches_per_fixture_engine():
+    lh, la, rho = _fixtures()
+    T, mk = scoreline_engine.price_fixtures(lh, la, rho)
+    G = T.shape[1] - 1
+    totals = scoreline_engine.batch_total_goals(T)
+    for n in range(len(lh)):
+        M = scoreline_engine.score_matrix(lh[n], la[n], rho[n], G)
+        assert np.allclose(T[n], M, rtol=0, atol=1e-15)
+        h, d, a = scoreline_engine.outcome_probs(M)
+        assert np.allclose([mk["home"][n], mk["draw"][n], mk["away"][n]], [h, d, a], rtol=0, atol=1e-14)
+        assert np.allclose(totals[n], scoreline_engine.total_goals_dist(M), rtol=0, atol=1e-15)
+
+        # نفس أرقام matrix_markets (بعد نفس التقريب)
+        ref = scoreline_engine.matrix_markets(M)
+        assert f"{round(100 * mk['btts'][n], 1)}%" == ref["BTTS_yes"]
+        assert f"{round(100 * mk['clean_sheet_home'][n], 1)}%" == ref["clean_sheet_home"]
+        assert f"{round(100 * mk['clean_sheet_away'][n], 1)}%" == ref["clean_sheet_away"]
+        for line, vu in ref["over_under"].items():
+            assert round(100 * mk[f"over_{line}"][n], 1) == vu["over"]
+            assert round(100 * mk[f"under_{line}"][n], 1) == vu["under"]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+import pytest
+
+import fd_predictor
+import scoreline_engine
+
+CASES = [
+    (1.45, 1.10, -0.08, 8),
+    (1.30, 1.30, 0.00, 10),   # λ متساوية → نتائج متعادلة الاحتمال (ترتيب top5 المستقر)
+    (2.60, 0.55, 0.12, 12),
+    (0.40, 3.20, -0.25, 15),
+    (0.00, 1.20, 0.05, 8),    # λ = 0 → كل كتلة المضيف عند 0
+]
+
+
+# --- المراجع: تنفيذ بايثون الصرف السابق (قبل محرك NumPy) ---
+def _ref_pmf(k, lam):
+    if lam <= 0:
+        return 1.0 if k == 0 else 0.0
+    return math.exp(k * math.log(lam) - lam - math.lgamma(k + 1))
+
+
+def _ref_matrix(lh, la, rho, max_goals):
+    pX = [_ref_pmf(i, lh) for i in range(max_goals + 1)]
+    pY = [_ref_pmf(j, la) for j in range(max_goals + 1)]
+    M = [[pX[i] * pY[j] for j in range(max_goals + 1)] for i in range(max_goals + 1)]
+    M[0][0] *= max(0.001, 1.0 - rho * lh * la)
+    M[0][1] *= max(0.001, 1.0 + rho * lh)
+    M[1][0] *= max(0.001, 1.0 + rho * la)
+    M[1][1] *= max(0.001, 1.0 - rho)
+    s = sum(sum(row) for row in M)
+    return [[v / s for v in row] for row in M]
+
+
+def _ref_outcomes(M):
+    n = len(M) - 1
+    p_home = p_draw = p_away = 0.0
+    top = []
+    for i in range(n + 1):
+        for j in range(n + 1):
+            pij = M[i][j]
+            if i > j:
+                p_home += pij
+            elif i == j:
+                p_draw += pij
+            else:
+                p_away += pij
+            top.append(((i, j), pij))
+    top.sort(key=lambda x: x[1], reverse=True)
+    return p_home, p_draw, p_away, [{"score": f"{s[0]}-{s[1]}", "prob": round(100 * p, 2)} for (s, p) in top[:5]]
+
+
+def _ref_markets(M):
+    n = len(M) - 1
+    p_btts = sum(M[i][j] for i in range(1, n + 1) for j in range(1, n + 1))
+    p_clean_home = sum(M[i][0] for i in range(n + 1))
+    p_clean_away = sum(M[0][j] for j in range(n + 1))
+    p_total = {t: 0.0 for t in range(0, 2 * n + 1)}
+    for i in range(n + 1):
+        for j in range(n + 1):
+            p_total[i + j] += M[i][j]
+    ou_lines = {}
+    for line in [1.5, 2.5, 3.5]:
+        u = sum(p_total.get(k, 0.0) for k in range(0, int(math.floor(line)) + 1))
+        ou_lines[str(line)] = {"over": round(100 * (1.0 - u), 1), "under": round(100 * u, 1)}
+    return {
+        "BTTS_yes": f"{round(100 * p_btts, 1)}%",
+        "clean_sheet_home": f"{round(100 * p_clean_home, 1)}%",
+        "clean_sheet_away": f"{round(100 * p_clean_away, 1)}%",
+        "over_under": ou_lines,
+    }
+
+
+@pytest.mark.parametrize("lh,la,rho,g", CASES)
+def test_engine_reproduces_pure_python_outputs(lh, la, rho, g):
+    ref = _ref_matrix(lh, la, rho, g)
+    M = fd_predictor.poisson_matrix_dc(lh, la, rho=rho, max_goals=g)
+    assert np.allclose(np.asarray(M), np.array(ref), rtol=0, atol=1e-15)
+
+    h, d, a, top5 = fd_predictor.matrix_to_outcomes(M)
+    rh, rd, ra, rtop5 = _ref_outcomes(ref)
+    assert abs(h - rh) < 1e-14 and abs(d - rd) < 1e-14 and abs(a - ra) < 1e-14
+    assert top5 == rtop5
+    assert fd_predictor.matrix_markets(M) == _ref_markets(ref)
+
+
+@pytest.mark.parametrize("lh,la,rho,g", CASES)
+def test_draw_prob_independent(lh, la, rho, g):
+    ref = sum(_ref_pmf(k, lh) * _ref_pmf(k, la) for k in range(g + 1))
+    assert abs(scoreline_engine.draw_prob_independent(lh, la, g) - ref) < 1e-15
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import fd_predictor
+
+
+def _season(seed=5, teams=20):
+    """ دوري ذهاباً وإياباً بقوى هجوم/دفاع عشوائية، كسجلات MatchRec. """
+    rng = np.random.default_rng(seed)
+    att = rng.uniform(0.7, 1.4, teams)
+    dfn = rng.uniform(0.7, 1.4, teams)
+    recs, mid = [], 1
+    for rnd, (h, a) in enumerate((h, a) for h in range(teams) for a in range(teams) if h != a):
+        day = 738000 + rnd // 10 * 7
+        hg = int(rng.poisson(1.5 * att[h] * dfn[a]))
+        ag = int(rng.poisson(1.1 * att[a] * dfn[h]))
+        recs.append(fd_predictor.MatchRec(mid, day, day * 86400 + mid, 100 + h, 100 + a, hg, ag, None, None, "FINISHED", None, 1))
+        mid += 1
+    return fd_predictor.MatchArrays(recs, ref_day=recs[-1].day)
+
+
+def _old_eight_pass(arr, avg_home, avg_away, prior_w=fd_predictor.PRIOR_GAMES, iters=8):
+    """ الحلقة القديمة (قبل bincount): 8 تمريرات ثابتة. """
+    tids = arr.team_ids.tolist()
+    ms = [{"h": tids[h], "a": tids[a], "hg": hg, "ag": ag, "w": w}
+          for h, a, hg, ag, w in zip(arr.home.tolist(), arr.away.tolist(), arr.hg.tolist(), arr.ag.tolist(), arr.w.tolist())]
+    A = {t: 1.0 for t in tids}
+    D = {t: 1.0 for t in tids}
+    clamp = fd_predictor.clamp
+    lo, hi = fd_predictor.AD_CLAMP_MIN, fd_predictor.AD_CLAMP_MAX
+    for _ in range(iters):
+        newA = {}
+        for i in tids:
+            num = den = prior_w * 1.0
+            for m in ms:
+                if m["h"] == i:
+                    num += m["w"] * (m["hg"] / max(1e-6, avg_home * D[m["a"]])); den += m["w"]
+                elif m["a"] == i:
+                    num += m["w"] * (m["ag"] / max(1e-6, avg_away * D[m["h"]])); den += m["w"]
+            newA[i] = clamp(num / den, lo, hi)
+        A = newA
+        newD = {}
+        for i in tids:
+            num = den = prior_w * 1.0
+            for m in ms:
+                if m["h"] == i:
+                    num += m["w"] * (m["ag"] / max(1e-6, avg_away * A[m["a"]])); den += m["w"]
+                elif m["a"] == i:
+                    num += m["w"] * (m["hg"] / max(1e-6, avg_home * A[m["h"]])); den += m["w"]
+            newD[i] = clamp(num / den, lo, hi)
+        D = newD
+        meanA, meanD = sum(A.values()) / len(A), sum(D.values()) / len(D)
+        A = {k: v / meanA for k, v in A.items()}
+        D = {k: v / meanD for k, v in D.items()}
+    return arr.vector(A), arr.vector(D)
+
+
+def test_fixed_passes_reproduce_old_loop():
+    arr = _season()
+    avg_h, avg_a = float(arr.hg.mean()), float(arr.ag.mean())
+    A_old, D_old = _old_eight_pass(arr, avg_h, avg_a)
+    A, D, iters = fd_predictor.solve_team_strengths(arr, avg_h, avg_a, iters=8, tol=0)
+    assert iters == 8
+    assert np.abs(A - A_old).max() < 1e-12 and np.abs(D - D_old).max() < 1e-12
+
+
+def test_converged_fit_stays_within_output_rounding_of_old_loop():
+    arr = _season()
+    avg_h, avg_a = float(arr.hg.mean()), float(arr.ag.mean())
+    A_old, D_old = _old_eight_pass(arr, avg_h, avg_a)
+    A, D, _ = fd_predictor.solve_team_strengths(arr, avg_h, avg_a)
+    # λ = avg·A·D تُعرض بأربع منازل عشرية
+    lam_old = avg_h * A_old[:, None] * D_old[None, :]
+    lam_new = avg_h * A[:, None] * D[None, :]
+    assert np.abs(lam_new - lam_old).max() < 5e-5